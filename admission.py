@@ -0,0 +1,230 @@
+import fcntl
+import heapq
+import itertools
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import requests
+
+from deadline import current_deadline
+from metrics import Counter, Gauge
+
+# --- ADMISSION CONTROL TOWARD THE ERP ---
+# One token bucket and one breaker state shared by every gunicorn worker through a
+# small flock'd file; the concurrency cap and its priority queue are per worker.
+LIMIT_FILE = os.environ.get("ERP_LIMIT_FILE", os.path.join(tempfile.gettempdir(), "challan-erp-limiter"))
+RATE = float(os.environ.get("ERP_RATE", "100"))  # requests/second across workers; 0 disables
+BURST = float(os.environ.get("ERP_BURST", "200"))
+MAX_INFLIGHT = int(os.environ.get("ERP_MAX_INFLIGHT", "8"))  # per worker
+MAX_QUEUE = int(os.environ.get("ERP_MAX_QUEUE", "32"))
+MAX_WAIT = float(os.environ.get("ERP_ADMISSION_WAIT", "5"))
+BREAKER_FAILURES = int(os.environ.get("ERP_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("ERP_BREAKER_COOLDOWN", "15"))
+
+# Lower runs first: a save that already has its bundles beats a new lookup
+PRIORITY = {'save': 0, 'login': 1, 'menu_valid': 1, 'menu_session': 1,
+            'search': 2, 'popup': 2, 'bundle_nos': 2, 'bundle_table': 2}
+# Hedges, report prefetches and anything else nobody is waiting on
+BACKGROUND_PRIORITY = 3
+
+QUEUE_DEPTH = Gauge("erp_admission_queue_depth", "Outbound ERP calls waiting for a concurrency slot.")
+INFLIGHT = Gauge("erp_admission_inflight", "Outbound ERP calls in flight.")
+REJECTED = Counter("erp_admission_rejected_total", "Outbound ERP calls refused before reaching the ERP.", ("reason",))
+RATE_WAIT = Counter("erp_rate_limit_wait_seconds_total", "Time spent waiting on the shared ERP token bucket.")
+CIRCUIT = Gauge("erp_circuit_open", "1 while the ERP circuit breaker is open.", merge='max')
+
+
+class ErpBusy(Exception):
+    pass
+
+
+class ErpUnavailable(Exception):
+    pass
+
+
+class SharedState:
+    """tokens, last refill and breaker open-until, packed in one file under flock."""
+
+    _FMT = struct.Struct("ddd")
+
+    def __init__(self, path=LIMIT_FILE):
+        self.path = path
+        self._fd, self._pid = None, None
+        self._lock = threading.Lock()
+
+    def _file(self):
+        # Opened on first use in each process: with --preload the module is
+        # imported in the master, and flock is held per open file, so workers
+        # sharing the master's descriptor would not exclude each other.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                    self._pid = os.getpid()
+        return self._fd
+
+    def update(self, fn):
+        fd = self._file()
+        with self._lock:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                raw = os.pread(fd, self._FMT.size, 0)
+                state = list(self._FMT.unpack(raw)) if len(raw) == self._FMT.size else [BURST, time.time(), 0.0]
+                result = fn(state)
+                os.pwrite(fd, self._FMT.pack(*state), 0)
+                return result
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def read(self):
+        raw = os.pread(self._file(), self._FMT.size, 0)
+        return self._FMT.unpack(raw) if len(raw) == self._FMT.size else (BURST, time.time(), 0.0)
+
+
+class PriorityGate:
+    """At most `limit` holders; waiters are woken lowest priority number first."""
+
+    def __init__(self, limit=MAX_INFLIGHT, max_queue=MAX_QUEUE):
+        self.limit, self.max_queue = limit, max_queue
+        self._active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, priority, timeout):
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                INFLIGHT.set(value=self._active)
+                return 'ok'
+            # Saves are never shed for queue length, only lookups
+            if priority > 0 and len(self._waiters) >= self.max_queue:
+                return 'queue_full'
+            waiter = (priority, next(self._seq), threading.Event())
+            heapq.heappush(self._waiters, waiter)
+            QUEUE_DEPTH.set(value=len(self._waiters))
+        if waiter[2].wait(timeout):
+            return 'ok'
+        with self._lock:
+            if waiter[2].is_set():
+                return 'ok'
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            QUEUE_DEPTH.set(value=len(self._waiters))
+        return 'timeout'
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # The slot passes straight to the next waiter; _active stays the same
+                heapq.heappop(self._waiters)[2].set()
+                QUEUE_DEPTH.set(value=len(self._waiters))
+            else:
+                self._active -= 1
+                INFLIGHT.set(value=self._active)
+
+
+class Admission:
+    def __init__(self, path=LIMIT_FILE, rate=RATE, burst=BURST):
+        self.rate, self.burst = rate, burst
+        self.shared = SharedState(path)
+        self.gate = PriorityGate()
+        self._failures = 0
+        self._half_open = False
+        self._lock = threading.Lock()
+
+    # --- token bucket ---
+    def _take(self, state):
+        now = time.time()
+        state[0] = min(self.burst, state[0] + max(0.0, now - state[1]) * self.rate)
+        state[1] = now
+        if state[0] >= 1:
+            state[0] -= 1
+            return 0.0
+        return (1 - state[0]) / self.rate
+
+    def _wait_for_token(self, budget):
+        if self.rate <= 0:
+            return True
+        waited = 0.0
+        while True:
+            delay = self.shared.update(self._take)
+            if delay == 0:
+                if waited:
+                    RATE_WAIT.inc(amount=waited)
+                return True
+            if waited + delay > budget:
+                RATE_WAIT.inc(amount=waited)
+                return False
+            time.sleep(delay)
+            waited += delay
+
+    # --- circuit breaker ---
+    def _open(self):
+        return time.time() < self.shared.read()[2]
+
+    def _record(self, ok):
+        with self._lock:
+            if ok:
+                self._failures, self._half_open = 0, False
+                return
+            self._failures += 1
+            # After a cooldown the first failure re-opens at once
+            trip = self._half_open or self._failures >= BREAKER_FAILURES
+            if trip:
+                self._failures, self._half_open = 0, True
+        if trip:
+            until = time.time() + BREAKER_COOLDOWN
+
+            def open_until(state):
+                state[2] = max(state[2], until)
+            self.shared.update(open_until)
+            CIRCUIT.set(value=1)
+
+    def _budget(self):
+        deadline = current_deadline()
+        return MAX_WAIT if deadline is None else max(0.0, min(MAX_WAIT, deadline.remaining()))
+
+    def call(self, stage, fn, *args, **kwargs):
+        # Set from the shared state, so workers that never tripped it report it too
+        if self._open():
+            CIRCUIT.set(value=1)
+            REJECTED.inc('circuit_open')
+            raise ErpUnavailable("🚧 ERP Not Responding, Try Again Shortly")
+        CIRCUIT.set(value=0)
+        priority = PRIORITY.get(stage, BACKGROUND_PRIORITY)
+        budget, started = self._budget(), time.monotonic()
+        outcome = self.gate.acquire(priority, budget)
+        if outcome != 'ok':
+            REJECTED.inc(outcome)
+            raise ErpBusy("⚠️ Server Busy, Try Again")
+        try:
+            if not self._wait_for_token(budget - (time.monotonic() - started)):
+                REJECTED.inc('rate_limited')
+                raise ErpBusy("⚠️ Server Busy, Try Again")
+            try:
+                res = fn(*args, **kwargs)
+            except requests.RequestException:
+                self._record(False)
+                raise
+            self._record(res.status_code < 500 and res.status_code != 429)
+            return res
+        finally:
+            self.gate.release()
+
+    def allow_retry(self):
+        """Retries count as failures and spend a token; none are made while the breaker is open."""
+        self._record(False)
+        if self._open():
+            REJECTED.inc('retry_circuit_open')
+            return False
+        if self.rate > 0 and self.shared.update(self._take) > 0:
+            REJECTED.inc('retry_rate_limited')
+            return False
+        return True
+
+
+ADMISSION = Admission()
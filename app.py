@@ -1,13 +1,29 @@
-from flask import Flask, request, jsonify, render_template_string
-import requests
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
+import gzip
+import hashlib
+import json
+import os
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from urllib.parse import quote_plus
+from bundle_parser import iter_bundle_rows
+from cache import TTLCache
+from deadline import CONNECT_TIMEOUT, Deadline, bind_deadline
+from erp_session import BASE_URL, HEARTBEAT_INTERVAL, MENU_REFERER, SAVE_URL, SessionPool, erp_headers
+from jobs import JobQueue
+from journal import HISTORY_PAGE_SIZE, Journal
+from metrics import BUNDLES, REQUEST_SECONDS, Trace, render_metrics
+from popup_parser import POPUP_FIELDS, popup_values
+from reports import ReportCache
+from singleflight import SingleFlight
 
 # --- CONFIGURATION ---
 app = Flask(__name__)
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "100"))
 
 # --- MNM SOFTWARE DESIGN (Updated Colors & Order) ---
 HTML_TEMPLATE = """
@@ -17,10 +33,11 @@ HTML_TEMPLATE = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
     <title>Sewing Input Portal</title>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800;900&family=JetBrains+Mono:wght@500;700&display=swap" rel="stylesheet">
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.1/css/all.min.css">
-    
+    {% for f in fonts %}<link rel="preload" href="/static/fonts/{{ f.file }}" as="font" type="font/woff2" crossorigin>
+    {% endfor %}
     <style>
+        {% for f in fonts %}@font-face { font-family: '{{ f.family }}'; src: url('/static/fonts/{{ f.file }}') format('woff2'); font-weight: {{ f.weight }}; font-display: swap; }
+        {% endfor %}
         :root {
             --bg-body: #0a0a0f;
             --bg-card: #16161f;
@@ -37,7 +54,8 @@ HTML_TEMPLATE = """
             --gradient-card: linear-gradient(145deg, rgba(22, 22, 31, 0.9) 0%, rgba(16, 16, 22, 0.95) 100%);
             --transition-smooth: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
         }
-        * { margin: 0; padding: 0; box-sizing: border-box; font-family: 'Inter', sans-serif; }
+        * { margin: 0; padding: 0; box-sizing: border-box; font-family: 'Inter', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif; }
+        .icon { width: 1em; height: 1em; fill: none; stroke: currentColor; stroke-width: 2; stroke-linecap: round; stroke-linejoin: round; vertical-align: -0.125em; }
         body {
             background: var(--bg-body); color: var(--text-primary); min-height: 100vh;
             display: flex; justify-content: center; align-items: center; overflow-x: hidden; position: relative;
@@ -89,7 +107,7 @@ HTML_TEMPLATE = """
             border-radius: 14px; 
             
             /* Font Change as requested */
-            font-family: 'JetBrains Mono', monospace; 
+            font-family: 'JetBrains Mono', ui-monospace, Menlo, Consolas, monospace; 
             font-size: 11px; font-weight: 700; text-align: center;
             color: var(--text-secondary); cursor: pointer; transition: all 0.3s ease;
             text-transform: uppercase; letter-spacing: -0.5px;
@@ -169,20 +187,50 @@ HTML_TEMPLATE = """
             border-right: 4px solid var(--col-orange); border-radius: 50%; animation: spin 0.8s linear infinite; box-shadow: 0 0 20px rgba(255, 122, 0, 0.4);
         }
         @keyframes spin { 0% { transform: rotate(0deg); } 100% { transform: rotate(360deg); } }
+        /* --- CONTINUOUS SCAN MODE --- */
+        .scan-toggle { display: flex; align-items: center; justify-content: space-between; margin-bottom: 20px; color: var(--text-secondary); font-size: 13px; font-weight: 600; cursor: pointer; }
+        .scan-toggle input { display: none; }
+        .switch { width: 40px; height: 22px; border-radius: 11px; background: rgba(255, 255, 255, 0.08); position: relative; transition: var(--transition-smooth); }
+        .switch::after { content: ''; position: absolute; top: 3px; left: 3px; width: 16px; height: 16px; border-radius: 50%; background: var(--text-secondary); transition: var(--transition-smooth); }
+        .scan-toggle input:checked + .switch { background: rgba(255, 122, 0, 0.3); }
+        .scan-toggle input:checked + .switch::after { left: 21px; background: var(--col-orange); }
+        #scanPanel { display: none; margin-top: 25px; }
+        .scan-head { display: flex; justify-content: space-between; align-items: center; font-size: 12px; color: var(--text-secondary); font-weight: 600; margin-bottom: 10px; }
+        .scan-head a { color: var(--text-secondary); text-decoration: none; }
+        .scan-list { display: flex; flex-direction: column; gap: 8px; max-height: 320px; overflow-y: auto; }
+        .scan-item { background: rgba(255, 255, 255, 0.03); border: 1px solid var(--border-color); border-radius: 12px; padding: 10px 14px; font-size: 13px; }
+        .scan-row { display: flex; justify-content: space-between; align-items: center; gap: 10px; }
+        .scan-no { font-family: 'JetBrains Mono', ui-monospace, Menlo, Consolas, monospace; font-weight: 700; }
+        .scan-state { font-size: 11px; font-weight: 700; text-transform: uppercase; color: var(--text-secondary); }
+        .scan-item.success .scan-state { color: var(--col-green); }
+        .scan-item.error .scan-state { color: #F87171; }
+        .scan-item.sending .scan-state { color: var(--col-orange); }
+        .scan-msg { margin-top: 4px; color: var(--text-secondary); font-size: 12px; }
+        .scan-msg a { color: var(--col-blue); text-decoration: none; margin-right: 12px; }
         .footer-credit { text-align: center; margin-top: 30px; color: var(--text-secondary); font-size: 11px; opacity: 0.6; font-weight: 500; letter-spacing: 0.5px; }
         .dev-name { color: var(--col-orange); font-weight: 700; text-transform: uppercase; }
     </style>
 </head>
 <body>
+    <svg width="0" height="0" style="position: absolute;" aria-hidden="true">
+        <symbol id="i-layers" viewBox="0 0 24 24"><polygon points="12 2 2 7 12 12 22 7 12 2"/><polyline points="2 17 12 22 22 17"/><polyline points="2 12 12 17 22 12"/></symbol>
+        <symbol id="i-arrow-right" viewBox="0 0 24 24"><line x1="5" y1="12" x2="19" y2="12"/><polyline points="12 5 19 12 12 19"/></symbol>
+        <symbol id="i-check-circle" viewBox="0 0 24 24"><path d="M22 11.08V12a10 10 0 1 1-5.93-9.14"/><polyline points="22 4 12 14.01 9 11.01"/></symbol>
+        <symbol id="i-printer" viewBox="0 0 24 24"><polyline points="6 9 6 2 18 2 18 9"/><path d="M6 18H4a2 2 0 0 1-2-2v-5a2 2 0 0 1 2-2h16a2 2 0 0 1 2 2v5a2 2 0 0 1-2 2h-2"/><rect x="6" y="14" width="12" height="8"/></symbol>
+        <symbol id="i-file-text" viewBox="0 0 24 24"><path d="M14 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V8z"/><polyline points="14 2 14 8 20 8"/><line x1="16" y1="13" x2="8" y2="13"/><line x1="16" y1="17" x2="8" y2="17"/></symbol>
+        <symbol id="i-rotate-cw" viewBox="0 0 24 24"><polyline points="23 4 23 10 17 10"/><path d="M20.49 15a9 9 0 1 1-2.12-9.36L23 10"/></symbol>
+        <symbol id="i-alert-triangle" viewBox="0 0 24 24"><path d="M10.29 3.86L1.82 18a2 2 0 0 0 1.71 3h16.94a2 2 0 0 0 1.71-3L13.71 3.86a2 2 0 0 0-3.42 0z"/><line x1="12" y1="9" x2="12" y2="13"/><line x1="12" y1="17" x2="12.01" y2="17"/></symbol>
+    </svg>
     <div class="bg-orb orb-1"></div><div class="bg-orb orb-2"></div><div class="bg-orb orb-3"></div>
     <div class="main-container">
         <div class="glass-card">
             <div id="loading-overlay">
                 <div class="spinner"></div>
                 <div style="margin-top: 15px; font-weight: 600; color: var(--col-orange); letter-spacing: 1px;">PROCESSING...</div>
+                <div id="loaderStatus" class="sys-text" style="margin-top: 6px;">Queued</div>
             </div>
             <div class="brand-section">
-                <div class="brand-icon"><i class="fa-solid fa-layer-group"></i></div>
+                <div class="brand-icon"><svg class="icon"><use href="#i-layers"></use></svg></div>
                 <div class="brand-title">SEWING<span>INPUT</span></div>
                 <div class="brand-subtitle">MNM Production System</div>
             </div>
@@ -213,24 +261,31 @@ HTML_TEMPLATE = """
                     </div>
                 </div>
 
-                <button type="submit" class="btn-action">Submit Data <i class="fa-solid fa-arrow-right ms-2"></i></button>
+                <label class="scan-toggle" for="scanMode">Continuous Scan <input type="checkbox" id="scanMode"><span class="switch"></span></label>
+
+                <button type="submit" class="btn-action">Submit Data <svg class="icon ms-2"><use href="#i-arrow-right"></use></svg></button>
             </form>
+            <div id="scanPanel">
+                <div class="scan-head"><span id="scanSummary">No scans yet</span><a href="#" id="clearDone">Clear finished</a></div>
+                <div class="scan-list" id="scanList"></div>
+            </div>
             <div id="successBox" class="result-box">
-                <div style="text-align: center;"><i class="fa-solid fa-circle-check status-icon-success"></i></div>
+                <div style="text-align: center;"><svg class="icon status-icon-success"><use href="#i-check-circle"></use></svg></div>
                 <div class="info-card">
                     <div class="challan-text" id="successChallan">---</div>
                     <div class="sys-text" id="sysId">---</div>
                 </div>
                 <div class="btn-grid">
-                    <a href="#" id="link1" target="_blank" class="btn-outline"><i class="fa-solid fa-print"></i> Call List</a>
-                    <a href="#" id="link2" target="_blank" class="btn-outline"><i class="fa-solid fa-file-invoice"></i> Challan</a>
+                    <a href="#" id="link1" target="_blank" class="btn-outline"><svg class="icon"><use href="#i-printer"></use></svg> Call List</a>
+                    <a href="#" id="link2" target="_blank" class="btn-outline"><svg class="icon"><use href="#i-file-text"></use></svg> Challan</a>
                 </div>
                 <div style="text-align: center; margin-top: 25px;">
-                    <a href="#" onclick="resetUI()" style="color: var(--text-secondary); text-decoration: none; font-size: 13px; font-weight: 500;"><i class="fa-solid fa-rotate-right me-1"></i> Input Another</a>
+                    <a href="#" onclick="resetUI()" style="color: var(--text-secondary); text-decoration: none; font-size: 13px; font-weight: 500;"><svg class="icon me-1"><use href="#i-rotate-cw"></use></svg> Input Another</a>
                 </div>
             </div>
             <div id="errorBox" class="result-box">
-                <div class="error-message"><i class="fa-solid fa-triangle-exclamation"></i> <span id="errorMsg">Unknown Error</span></div>
+                <div class="error-message"><svg class="icon"><use href="#i-alert-triangle"></use></svg> <span id="errorMsg">Unknown Error</span></div>
+                <button id="resumeBtn" class="btn-outline w-100" style="display: none; margin-bottom: 10px;"><svg class="icon me-1"><use href="#i-rotate-cw"></use></svg> Resume Save</button>
                 <button onclick="resetUI()" class="btn-outline w-100" style="color: var(--accent-red); border-color: rgba(239, 68, 68, 0.3);">Try Again</button>
             </div>
             <div class="footer-credit">System Developed By <span class="dev-name">Mehedi Hasan</span></div>
@@ -242,6 +297,32 @@ HTML_TEMPLATE = """
         const loader = document.getElementById('loading-overlay');
         const successBox = document.getElementById('successBox');
         const errorBox = document.getElementById('errorBox');
+        const loaderStatus = document.getElementById('loaderStatus');
+        const sleep = (ms) => new Promise(r => setTimeout(r, ms));
+
+        // Submit as an async job, then poll until the ERP round trip finishes
+        async function submitChallan(challan, companyId, onState, extra) {
+            const req = await fetch('/process', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({ challan: challan, company_id: companyId, async: true, ...extra })
+            });
+            let job = await req.json();
+            if (!job.job_id) return job;
+
+            const started = Date.now();
+            const limit = (job.max_wait || 60) * 1000;
+            let delay = 300;
+            while (Date.now() - started < limit) {
+                await sleep(delay);
+                delay = Math.min(delay + 200, 1000);
+                const poll = await fetch('/jobs/' + job.job_id, {cache: 'no-store'});
+                job = await poll.json();
+                if (job.state === 'done' || poll.status === 404) return job;
+                if (onState) onState(job.state, Math.round((Date.now() - started) / 1000));
+            }
+            return {status: 'error', message: '⏱️ No Answer From Server, Check History Before Retrying'};
+        }
 
         form.addEventListener('submit', async (e) => {
             e.preventDefault();
@@ -252,18 +333,34 @@ HTML_TEMPLATE = """
             if(!companyEl) { alert("Please Select a Company"); return; }
 
             const companyId = companyEl.value;
+            if (scanMode.checked) {
+                input.value = '';
+                input.focus();
+                await enqueueScan(val, companyId);
+                return;
+            }
             input.blur(); 
+            await runMain(val, companyId, {});
+        });
+
+        // A partial save is finished by posting only its missing bundles to the same challan
+        const resumeBtn = document.getElementById('resumeBtn');
+        let resumeTarget = null;
+        resumeBtn.addEventListener('click', () => {
+            if (resumeTarget) runMain(resumeTarget.challan, resumeTarget.companyId, {resume: resumeTarget.systemId});
+        });
+
+        async function runMain(val, companyId, extra) {
+            loaderStatus.innerText = 'Queued';
             loader.style.display = 'flex';
             successBox.style.display = 'none';
             errorBox.style.display = 'none';
+            resumeBtn.style.display = 'none';
 
             try {
-                const req = await fetch('/process', {
-                    method: 'POST', 
-                    headers: {'Content-Type': 'application/json'}, 
-                    body: JSON.stringify({ challan: val, company_id: companyId })
-                });
-                const res = await req.json();
+                const res = await submitChallan(val, companyId, (state, secs) => {
+                    loaderStatus.innerText = (state === 'running' ? 'Talking to ERP' : 'Queued') + ' · ' + secs + 's';
+                }, extra);
                 loader.style.display = 'none';
 
                 if(res.status === 'success') {
@@ -274,6 +371,10 @@ HTML_TEMPLATE = """
                     successBox.style.display = 'block';
                 } else {
                     document.getElementById('errorMsg').innerText = res.message;
+                    if (res.partial) {
+                        resumeTarget = {challan: val, companyId: companyId, systemId: res.system_id};
+                        resumeBtn.style.display = 'block';
+                    }
                     errorBox.style.display = 'block';
                 }
             } catch (err) {
@@ -281,8 +382,162 @@ HTML_TEMPLATE = """
                 document.getElementById('errorMsg').innerText = "Server Connection Error";
                 errorBox.style.display = 'block';
             }
+        }
+
+        // --- CONTINUOUS SCAN QUEUE (IndexedDB, survives reloads and dropped Wi-Fi) ---
+        const scanMode = document.getElementById('scanMode');
+        const scanPanel = document.getElementById('scanPanel');
+        const scanList = document.getElementById('scanList');
+        const SCAN_CONCURRENCY = 2;
+        const COMPANY_NAMES = {'1': 'Cotton Club BD', '2': 'Cotton Clothing', '3': 'Tropical Knitex', '4': 'Cotton Clout BD'};
+        let scans = [];
+        let active = 0;
+        let dbPromise = null;
+
+        function db() {
+            if (!dbPromise) dbPromise = new Promise((resolve, reject) => {
+                const req = indexedDB.open('sewing-input', 1);
+                req.onupgradeneeded = () => req.result.createObjectStore('scans', {keyPath: 'id', autoIncrement: true});
+                req.onsuccess = () => resolve(req.result);
+                req.onerror = () => reject(req.error);
+            });
+            return dbPromise;
+        }
+        async function dbRun(mode, fn) {
+            const d = await db();
+            return new Promise((resolve, reject) => {
+                const tx = d.transaction('scans', mode);
+                const req = fn(tx.objectStore('scans'));
+                tx.oncomplete = () => resolve(req && req.result);
+                tx.onerror = () => reject(tx.error);
+            });
+        }
+        const saveScan = (scan) => dbRun('readwrite', s => s.put(scan));
+
+        async function enqueueScan(challan, companyId) {
+            const scan = {challan: challan, company_id: companyId, state: 'queued', message: '', ts: Date.now()};
+            scan.id = await dbRun('readwrite', s => s.add(scan));
+            scans.unshift(scan);
+            renderScans();
+            pump();
+        }
+
+        function pump() {
+            while (active < SCAN_CONCURRENCY && navigator.onLine !== false) {
+                const next = scans.filter(s => s.state === 'queued').sort((a, b) => a.ts - b.ts)[0];
+                if (!next) return;
+                active++;
+                runScan(next).finally(() => { active--; pump(); });
+            }
+        }
+
+        async function runScan(scan) {
+            scan.state = 'sending';
+            scan.message = '';
+            await saveScan(scan);
+            renderScans();
+            try {
+                const res = await submitChallan(scan.challan, scan.company_id, (state, secs) => {
+                    scan.message = (state === 'running' ? 'Talking to ERP' : 'Queued on server') + ' · ' + secs + 's';
+                    renderScans();
+                }, scan.resume ? {resume: scan.resume} : {});
+                scan.resume = null;
+                scan.partial = res.partial ? res.system_id : null;
+                // A retry after a lost response, or a re-queue after a reload, finds the
+                // challan already in the journal; it is saved, so show it with its reports
+                const saved = res.status === 'success' || res.already_saved;
+                scan.state = saved ? 'success' : 'error';
+                scan.result = res;
+                scan.message = res.status === 'success' ? res.challan_no : res.already_saved ? res.challan_no + ' (saved earlier)' : res.message;
+            } catch (err) {
+                // Network trouble: keep it queued and try again when the connection is back
+                scan.state = 'queued';
+                scan.message = 'Waiting for network';
+                await sleep(3000);
+            }
+            await saveScan(scan);
+            renderScans();
+        }
+
+        function renderScans() {
+            scanList.replaceChildren(...scans.map(scan => {
+                const item = document.createElement('div');
+                item.className = 'scan-item ' + scan.state;
+                const row = document.createElement('div');
+                row.className = 'scan-row';
+                const no = document.createElement('span');
+                no.className = 'scan-no';
+                no.textContent = scan.challan + ' · ' + (COMPANY_NAMES[scan.company_id] || scan.company_id);
+                const state = document.createElement('span');
+                state.className = 'scan-state';
+                state.textContent = scan.state;
+                row.append(no, state);
+                const msg = document.createElement('div');
+                msg.className = 'scan-msg';
+                if (scan.state === 'success') {
+                    for (const [label, url] of [['Call List', scan.result.report1_url], ['Challan', scan.result.report2_url]]) {
+                        const a = document.createElement('a');
+                        a.href = url; a.target = '_blank'; a.textContent = label;
+                        msg.append(a);
+                    }
+                    msg.append(scan.message + ' · SYS ' + scan.result.system_id);
+                } else {
+                    msg.textContent = scan.message;
+                    if (scan.state === 'error' && scan.partial) {
+                        const a = document.createElement('a');
+                        a.href = '#'; a.textContent = 'Resume';
+                        a.addEventListener('click', async (e) => {
+                            e.preventDefault();
+                            scan.resume = scan.partial;
+                            scan.state = 'queued';
+                            await saveScan(scan);
+                            renderScans();
+                            pump();
+                        });
+                        msg.prepend(a);
+                    }
+                }
+                item.append(row, msg);
+                return item;
+            }));
+            const pending = scans.filter(s => s.state === 'queued' || s.state === 'sending').length;
+            const ok = scans.filter(s => s.state === 'success').length;
+            document.getElementById('scanSummary').textContent = scans.length ? `${pending} pending · ${ok} saved · ${scans.length - pending - ok} failed` : 'No scans yet';
+        }
+
+        document.getElementById('clearDone').addEventListener('click', async (e) => {
+            e.preventDefault();
+            const done = scans.filter(s => s.state === 'success' || s.state === 'error');
+            await dbRun('readwrite', s => { done.forEach(d => s.delete(d.id)); });
+            scans = scans.filter(s => !done.includes(s));
+            renderScans();
         });
 
+        function setScanMode(on) {
+            scanPanel.style.display = on ? 'block' : 'none';
+            localStorage.setItem('scanMode', on ? '1' : '0');
+            if (on) { successBox.style.display = 'none'; errorBox.style.display = 'none'; input.focus(); }
+        }
+        scanMode.addEventListener('change', () => setScanMode(scanMode.checked));
+        window.addEventListener('online', pump);
+
+        (async () => {
+            if (!('indexedDB' in window)) { scanMode.disabled = true; return; }
+            scans = (await dbRun('readonly', s => s.getAll())) || [];
+            // Anything cut off mid-flight by a reload goes back in the queue. If it was saved
+            // after all, the journal answers already_saved and runScan shows it as saved.
+            for (const s of scans) if (s.state === 'sending') { s.state = 'queued'; await saveScan(s); }
+            scans.sort((a, b) => b.ts - a.ts);
+            scanMode.checked = localStorage.getItem('scanMode') === '1' || scans.some(s => s.state === 'queued');
+            setScanMode(scanMode.checked);
+            renderScans();
+            pump();
+        })();
+
+        if ('serviceWorker' in navigator) {
+            window.addEventListener('load', () => navigator.serviceWorker.register('/sw.js').catch(() => {}));
+        }
+
         function resetUI() {
             input.value = '';
             successBox.style.display = 'none';
@@ -294,167 +549,362 @@ HTML_TEMPLATE = """
 </html>
 """
 
-# --- BACKEND LOGIC ---
-def process_data(user_input, client_ua, company_id):
-    base_url = "http://180.92.235.190:8022/erp"
-    
-    headers_common = {
-        'User-Agent': client_ua if client_ua else 'Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Mobile Safari/537.36',
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'Origin': 'http://180.92.235.190:8022/',
-        'Referer': f"{base_url}/login.php"
+# --- SERVICE WORKER (app shell) ---
+SW_SCRIPT = """
+const SHELL = 'sewing-shell-v1';
+
+self.addEventListener('install', (e) => {
+    e.waitUntil(caches.open(SHELL).then(c => c.addAll(['/'])).then(() => self.skipWaiting()));
+});
+self.addEventListener('activate', (e) => {
+    e.waitUntil(caches.keys().then(keys => Promise.all(keys.filter(k => k !== SHELL).map(k => caches.delete(k))))
+        .then(() => self.clients.claim()));
+});
+self.addEventListener('fetch', (e) => {
+    const url = new URL(e.request.url);
+    if (e.request.method !== 'GET' || url.origin !== location.origin) return;
+    if (url.pathname.startsWith('/static/fonts/')) {
+        // Fonts never change under the same name
+        e.respondWith(caches.match(e.request).then(hit => hit || fetch(e.request).then(res => {
+            const copy = res.clone();
+            caches.open(SHELL).then(c => c.put(e.request, copy));
+            return res;
+        })));
+    } else if (url.pathname === '/') {
+        // Revalidate with the ETag (a 304 on a normal day), fall back to the cached shell offline
+        e.respondWith(fetch(e.request).then(res => {
+            if (res.ok) { const copy = res.clone(); caches.open(SHELL).then(c => c.put('/', copy)); }
+            return res;
+        }).catch(() => caches.match('/')));
     }
+});
+"""
 
-    session = requests.Session()
-    retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("http://", adapter)
+# --- STATIC PAGE ---
+FONT_DIR = os.path.join(app.root_path, 'static', 'fonts')
+FONTS = [
+    {'family': 'Inter', 'file': 'Inter-Variable.woff2', 'weight': '300 900'},
+]
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 31536000
 
-    try:
-        # 1. Login
-        session.post(f"{base_url}/login.php", data={'txt_userid': 'input1.clothing-cutting', 'txt_password': '123456', 'submit': 'Login'}, headers=headers_common)
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-        # 2. Session Activate
-        headers_menu = headers_common.copy()
-        headers_menu['Referer'] = f"{base_url}/production/bundle_wise_sewing_input.php?permission=1_1_2_1"
-        try:
-            session.get(f"{base_url}/tools/valid_user_action.php?menuid=724", headers=headers_menu)
-            session.get(f"{base_url}/includes/common_functions_for_js.php?data=724_7_406&action=create_menu_session", headers=headers_menu)
-        except: pass
+class StaticPage:
+    """A page rendered once, kept as identity/gzip/brotli bytes, each behind its own strong ETag."""
 
-        # 3. Logic Setup (Direct Assignment)
-        cbo_logic = str(company_id) 
-        
-        ctrl_url = f"{base_url}/production/requires/bundle_wise_cutting_delevar_to_input_controller.php"
-        headers_ajax = headers_common.copy()
-        headers_ajax['X-Requested-With'] = 'XMLHttpRequest'
-        if 'Content-Type' in headers_ajax: del headers_ajax['Content-Type']
-
-        # 4. Search and Get Popup Data
-        res = session.get(ctrl_url, params={'data': f"{user_input}_0__{cbo_logic}_2__1_", 'action': 'create_challan_search_list_view'}, headers=headers_ajax)
-        mid = re.search(r"js_set_value\((\d+)\)", res.text)
-        if not mid: return {"status": "error", "message": "❌ Invalid Challan / No Data"}
-        sys_id = mid.group(1)
-
-        res_pop = session.post(ctrl_url, params={'data': sys_id, 'action': 'populate_data_from_challan_popup'}, data={'rndval': int(time.time()*1000)}, headers=headers_common)
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        self.variants = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body)
+        # Strong ETags promise byte-identical bodies, so each encoding gets its own
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        self.etags = {e: f'"{digest}-{e}"' for e in self.variants}
+
+    def response(self):
+        encoding = next((e for e in ('br', 'gzip') if e in self.variants and e in request.accept_encodings), 'identity')
+        headers = {'ETag': self.etags[encoding], 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if self.etags[encoding] in request.headers.get('If-None-Match', ''):
+            return Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.variants[encoding], mimetype=self.mimetype, headers=headers)
+
+def build_pages():
+    # Only fonts that were actually dropped into static/fonts get an @font-face
+    fonts = [f for f in FONTS if os.path.exists(os.path.join(FONT_DIR, f['file']))]
+    with app.app_context():
+        html = render_template_string(HTML_TEMPLATE, fonts=fonts)
+    return StaticPage(html.encode('utf-8'), 'text/html'), StaticPage(SW_SCRIPT.encode('utf-8'), 'application/javascript')
+
+INDEX_PAGE, SW_PAGE = build_pages()
+
+# --- BACKEND LOGIC ---
+erp_pool = SessionPool()
+job_queue = JobQueue()
+lookup_cache = TTLCache()
+inflight = SingleFlight()
+journal = Journal()
+reports = ReportCache(erp_pool)
+SSE_MAX_SECONDS = 120
+# Clients give up polling this long after the server itself would call the job failed
+JOB_POLL_MARGIN = 10
+SYS_ID_LINK = re.compile(r"js_set_value\((\d+)\)")
+
+# --- WARM START ---
+# One logged-in session per company in the selector (sessions are not tied to a company)
+WARM_SESSIONS = int(os.environ.get("ERP_WARM_SESSIONS", "4"))
+warm = threading.Event()
+_warm_started = threading.Lock()
+
+def warm_up():
+    """Log in the pool and keep it alive in the background; /ready reports when it is done."""
+    if not _warm_started.acquire(blocking=False):
+        return
+
+    def run():
+        delay = 1
+        while not warm.is_set():
+            try:
+                with bind_deadline(Deadline()):
+                    if erp_pool.warm(WARM_SESSIONS) > 0:
+                        warm.set()
+                        break
+            except Exception:
+                pass
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+        while True:
+            time.sleep(min(60, HEARTBEAT_INTERVAL))
+            with bind_deadline(Deadline()):
+                erp_pool.heartbeat()
+
+    threading.Thread(target=run, name="erp-warm", daemon=True).start()
+
+# --- SAVE PAYLOAD ---
+# Off (0) by default: every bundle goes in one POST, as it always has. A positive
+# value saves big challans in slices of that many bundles: the first creates the
+# challan and the rest are posted to it with operation=1. That the ERP appends
+# those rows instead of replacing the challan's rows is an assumption not yet
+# checked against the live ERP, so keep this off until it is. With 15 form
+# variables per bundle plus ~20 header ones, 60 keeps each POST under PHP's
+# max_input_vars=1000.
+SAVE_CHUNK_SIZE = int(os.environ.get("SAVE_CHUNK_SIZE", "0"))
+if SAVE_CHUNK_SIZE < 0:
+    raise ValueError("SAVE_CHUNK_SIZE must be 0 (one POST per challan) or a number of bundles per POST")
+# A save that times out may still have been committed, so its read is never cut
+# short by the request deadline; it gets this long, however late it started
+SAVE_TIMEOUT = float(os.environ.get("ERP_SAVE_TIMEOUT", "60"))
+# Chunks after the first run on their own budget, this much per chunk
+APPEND_SECONDS = float(os.environ.get("SAVE_APPEND_SECONDS", "10"))
+RESUME_SYS_ID = re.compile(r"^\d{1,12}$")
+
+def save_header(f, operation='0', system_id='', challan_no=''):
+    return [
+        ('action', 'save_update_delete'), ('operation', operation),
+        ('garments_nature', "'2'"), ('cbo_company_name', f"'{f['company']}'"), ('sewing_production_variable', "'3'"),
+        ('cbo_source', f"'{f['source']}'"), ('cbo_emb_company', f"'{f['emb_company']}'"),
+        ('cbo_location', f"'{f['location']}'"), ('cbo_floor', f"'{f['floor']}'"),
+        ('txt_issue_date', f"'{f['date']}'"), ('txt_organic', "''"), ('txt_system_id', f"'{system_id}'"), ('delivery_basis', "'3'"),
+        ('txt_challan_no', f"'{challan_no}'"), ('cbo_line_no', f"'{f['line']}'"), ('cbo_shift_name', "'0'"),
+        ('cbo_working_company_name', "'0'"), ('cbo_working_location', "'0'"),
+        ('txt_remarks', "''"), ('txt_reporting_hour', f"'{f['time']}'"),
+    ]
+
+def encode_save_body(header, rows):
+    # Straight to the urlencoded body; numeric fields are digits-only from bundle_parser
+    parts = [f"{k}={quote_plus(v)}" for k, v in header]
+    parts.append(f"tot_row={len(rows)}")
+    for i, b in enumerate(rows, 1):
+        parts.append(
+            f"bundleNo_{i}={quote_plus(b.bundleNo)}&orderId_{i}={b.orderId}&gmtsitemId_{i}={b.gmtsitemId}"
+            f"&countryId_{i}={b.countryId}&colorId_{i}={b.colorId}&sizeId_{i}={b.sizeId}&inseamId_{i}=0"
+            f"&colorSizeId_{i}={b.colorSizeId}&qty_{i}={b.qty}&dtlsId_{i}={b.dtlsId}&cutNo_{i}={quote_plus(b.cutNo)}"
+            f"&isRescan_{i}={b.isRescan}&barcodeNo_{i}={b.barcodeNo}&cutMstIdNo_{i}=0&cutNumPrefixNo_{i}=0")
+    return "&".join(parts).encode()
+
+def post_save(session, body, headers, trace):
+    # Never hedged: a duplicate save would post the bundles twice
+    return session.post(SAVE_URL, data=body, headers=headers, stage='save', trace=trace, timeout=(CONNECT_TIMEOUT, SAVE_TIMEOUT))
+
+def append_rows(session, fields, rows, result, headers, trace, total):
+    """Add `rows` to the challan saved in `result`, SAVE_CHUNK_SIZE at a time.
+
+    Uses operation=1, the entry form's update, against the saved system id, and
+    takes a `1**` reply as appended. Both are assumptions about the ERP; see
+    SAVE_CHUNK_SIZE. The bundles still missing go to the journal as
+    `pending_barcodes`, which is what a resume posts.
+    """
+    header = save_header(fields, operation='1', system_id=result['system_id'], challan_no=result['challan_no'])
+    size = SAVE_CHUNK_SIZE or len(rows)
+    chunks = [rows[i:i + size] for i in range(0, len(rows), size)]
+    with bind_deadline(Deadline(APPEND_SECONDS * len(chunks))) as deadline:
+        for i, chunk in enumerate(chunks):
+            try:
+                ok = deadline.remaining() > 0 and post_save(session, encode_save_body(header, chunk), headers, trace).text.split('**')[0].strip() == '1'
+            except Exception:
+                ok = False
+            if not ok:
+                # A chunk that timed out counts as unsaved; resuming posts it again
+                pending = [b.barcodeNo for c in chunks[i:] for b in c]
+                saved = total - len(pending)
+                return {**result, "status": "error", "partial": True, "saved_bundles": saved, "total_bundles": total,
+                        "pending_barcodes": pending, "message": f"⚠️ Partial Save: {saved}/{total} bundles on {result['challan_no']}"}
+    return result
+
+def report_urls(new_sys_id):
+    # Served from the local report cache; see reports.py
+    return f"/report/{new_sys_id}/call_list", f"/report/{new_sys_id}/challan"
+
+def process_data(user_input, client_ua, company_id, trace=None, force=False, resume=None):
+    trace = trace or Trace()
+
+    # A challan this portal already saved would only come back as code 20 after the full round trip
+    if not force and not resume:
+        saved = journal.saved(user_input, company_id)
+        if saved is not None:
+            result = {"status": "error", "message": "❌ Bundle Already Scanned!", "already_saved": True, "saved_at": saved['ts'],
+                      **{k: saved[k] for k in ('challan_no', 'system_id', 'report1_url', 'report2_url')}}
+            journal.record(user_input, company_id, result, trace.elapsed(), source='journal')
+            REQUEST_SECONDS.observe(trace.elapsed(), 'error')
+            return result
+        # A fresh save would open a second challan next to the half-saved one
+        partial = journal.pending_save(user_input, company_id)
+        if partial is not None:
+            result = {"status": "error", "partial": True, "system_id": partial['system_id'], "challan_no": partial['challan_no'],
+                      "message": f"⚠️ Partial Save Pending on {partial['challan_no']}, Resume It"}
+            journal.record(user_input, company_id, result, trace.elapsed(), source='journal')
+            REQUEST_SECONDS.observe(trace.elapsed(), 'error')
+            return result
+
+    if resume:
+        # Only what the journal says this challan's partial save left behind; the
+        # client names the system id and nothing else
+        resume = journal.pending_save(user_input, company_id, resume)
+        if resume is None:
+            REQUEST_SECONDS.observe(trace.elapsed(), 'error')
+            return {"status": "error", "message": "❌ Nothing To Resume"}
+
+    def run():
+        with bind_deadline(Deadline()):
+            result = _process_data(user_input, client_ua, company_id, trace, resume)
+        if result.get('status') == 'success':
+            # Rendered now, in the background, so the print button opens instantly
+            reports.prefetch(result['system_id'], client_ua)
+        return result
+
+    # Double taps and two phones on one challan share a single ERP pipeline
+    key = f"{user_input}|{company_id}" + (f"|{resume['system_id']}" if resume else "")
+    result = inflight.do(key, run)
+    journal.record(user_input, company_id, result, trace.elapsed())
+    REQUEST_SECONDS.observe(trace.elapsed(), result.get('status', 'error'))
+    # Merged callers share this dict and each journals it, so copy rather than pop
+    return {k: v for k, v in result.items() if k != 'pending_barcodes'}
+
+def _process_data(user_input, client_ua, company_id, trace, resume=None):
+    base_url = BASE_URL
+    headers_common = erp_headers(client_ua)
+
+    try:
+        with erp_pool.session(client_ua, trace) as session:
+            # 1. Logic Setup (Direct Assignment)
+            cbo_logic = str(company_id) 
         
-        def get_val(id_name, text):
-            pattern = re.escape(id_name) + r".*?\.val\(\s*['\"]?([^'\")]+)['\"]?\s*\)"
-            m = re.search(pattern, text)
-            return m.group(1).strip() if m else '0'
-
-        source = get_val("cbo_source", res_pop.text)
-        emb_company = get_val("cbo_emb_company", res_pop.text)
-        line = get_val("cbo_line_no", res_pop.text)
-        location = get_val("cbo_location", res_pop.text)
-        floor = get_val("cbo_floor", res_pop.text)
-
-        # Validation
-        forbidden = ['0', '00', '', 'undefined', 'null']
-        missing_fields = []
-        if source in forbidden: missing_fields.append("Source")
-        if emb_company in forbidden: missing_fields.append("Emb Company")
-        if line in forbidden: missing_fields.append("Line No")
-        if location in forbidden: missing_fields.append("Location")
+            ctrl_url = f"{base_url}/production/requires/bundle_wise_cutting_delevar_to_input_controller.php"
+            headers_ajax = headers_common.copy()
+            headers_ajax['X-Requested-With'] = 'XMLHttpRequest'
+            if 'Content-Type' in headers_ajax: del headers_ajax['Content-Type']
+
+            # 2. Search and Get Popup Data (cached per challan/company for quick retries)
+            cache_key = f"{user_input}|{cbo_logic}"
+            cached = lookup_cache.get(cache_key) or {}
+            sys_id = cached.get('sys_id')
+            if not sys_id:
+                # The list can be long; stop reading at the first js_set_value(<id>)
+                with erp_pool.hedged_stream(session, ctrl_url, 'search', trace, params={'data': f"{user_input}_0__{cbo_logic}_2__1_", 'action': 'create_challan_search_list_view'}, headers=headers_ajax) as body:
+                    mid = body.search(SYS_ID_LINK)
+                if not mid: return {"status": "error", "message": "❌ Invalid Challan / No Data"}
+                sys_id = mid.group(1)
+                lookup_cache.set(cache_key, {'sys_id': sys_id})
+
+            popup = cached.get('popup')
+            if popup:
+                source, emb_company, line, location, floor = popup
+            else:
+                res_pop = session.post(ctrl_url, params={'data': sys_id, 'action': 'populate_data_from_challan_popup'}, data={'rndval': int(time.time()*1000)}, headers=headers_common, stage='popup', trace=trace)
+                # One pass for the five fields below; parse_popup(text, names=None) has every other field
+                popup_fields = popup_values(res_pop.text)
+                source, emb_company, line, location, floor = (popup_fields[k] for k in POPUP_FIELDS)
+
+            # Validation
+            forbidden = ['0', '00', '', 'undefined', 'null']
+            missing_fields = []
+            if source in forbidden: missing_fields.append("Source")
+            if emb_company in forbidden: missing_fields.append("Emb Company")
+            if line in forbidden: missing_fields.append("Line No")
+            if location in forbidden: missing_fields.append("Location")
         
-        if missing_fields:
-            return {"status": "error", "message": f"⚠️ Missing/Zero: {', '.join(missing_fields)}"}
-
-        # Bundles Extraction
-        res_bun = session.get(ctrl_url, params={'data': sys_id, 'action': 'bundle_nos'}, headers=headers_ajax)
-        raw_bun = res_bun.text.split("**")[0]
-        if not raw_bun: return {"status": "error", "message": "❌ Empty Bundle List"}
-
-        res_tbl = session.get(ctrl_url, params={'data': f"{raw_bun}**0**{sys_id}**{cbo_logic}**{line}", 'action': 'populate_bundle_data_update'}, headers=headers_ajax)
-        rows = res_tbl.text.split('<tr')
-        b_data = []
-        for r in rows:
-            if 'id="tr_' not in r: continue
-            def get_row_val(pat, txt):
-                m = re.search(pat, txt)
-                return m.group(1) if m else '0'
-            
-            b_data.append({
-                'barcodeNo': get_row_val(r"title=\"(\d+)\"", r), 
-                'bundleNo': get_row_val(r"id=\"bundle_\d+\"[^>]*>([^<]+)", r),
-                'orderId': get_row_val(r"name=\"orderId\[\]\".*?value=\"(\d+)\"", r), 
-                'gmtsitemId': get_row_val(r"name=\"gmtsitemId\[\]\".*?value=\"(\d+)\"", r),
-                'countryId': get_row_val(r"name=\"countryId\[\]\".*?value=\"(\d+)\"", r), 
-                'colorId': get_row_val(r"name=\"colorId\[\]\".*?value=\"(\d+)\"", r),
-                'sizeId': get_row_val(r"name=\"sizeId\[\]\".*?value=\"(\d+)\"", r), 
-                'colorSizeId': get_row_val(r"name=\"colorSizeId\[\]\".*?value=\"(\d+)\"", r),
-                'qty': get_row_val(r"name=\"qty\[\]\".*?value=\"(\d+)\"", r), 
-                'dtlsId': get_row_val(r"name=\"dtlsId\[\]\".*?value=\"(\d+)\"", r),
-                'cutNo': get_row_val(r"name=\"cutNo\[\]\".*?value=\"([^\"]+)\"", r), 
-                'isRescan': get_row_val(r"name=\"isRescan\[\]\".*?value=\"(\d+)\"", r)
-            })
-
-        # 5. Save Payload
-        bd_zone = timezone(timedelta(hours=6))
-        now_bd = datetime.now(bd_zone)
+            if missing_fields:
+                # Only the sys_id is kept, so the retry re-reads the fields once they are fixed in the ERP
+                return {"status": "error", "message": f"⚠️ Missing/Zero: {', '.join(missing_fields)}"}
+            if not popup:
+                lookup_cache.set(cache_key, {'sys_id': sys_id, 'popup': [source, emb_company, line, location, floor]})
+
+            # Bundles Extraction
+            # Both are streamed: rows are parsed as they arrive instead of from full-size copies of the body
+            with erp_pool.hedged_stream(session, ctrl_url, 'bundle_nos', trace, params={'data': sys_id, 'action': 'bundle_nos'}, headers=headers_ajax) as body:
+                raw_bun = body.read_until("**")
+            if not raw_bun: return {"status": "error", "message": "❌ Empty Bundle List"}
+
+            with erp_pool.hedged_stream(session, ctrl_url, 'bundle_table', trace, params={'data': f"{raw_bun}**0**{sys_id}**{cbo_logic}**{line}", 'action': 'populate_bundle_data_update'}, headers=headers_ajax) as body:
+                b_data = list(iter_bundle_rows(body))
+            BUNDLES.observe(len(b_data))
+
+            # 3. Save Payload
+            bd_zone = timezone(timedelta(hours=6))
+            now_bd = datetime.now(bd_zone)
         
-        # যদি আজ শুক্রবার (weekday() == 4) হয়, তাহলে গতকালের তারিখ ব্যবহার করো
-        if now_bd.weekday() == 4:  # শুক্রবার = 4 (Monday=0, Friday=4)
-            save_date = now_bd - timedelta(days=1)  # গতকালের তারিখ (বৃহস্পতিবার)
-        else:
-            save_date = now_bd  # অন্যান্য দিনে আজকের তারিখ
+            # যদি আজ শুক্রবার (weekday() == 4) হয়, তাহলে গতকালের তারিখ ব্যবহার করো
+            if now_bd.weekday() == 4:  # শুক্রবার = 4 (Monday=0, Friday=4)
+                save_date = now_bd - timedelta(days=1)  # গতকালের তারিখ (বৃহস্পতিবার)
+            else:
+                save_date = now_bd  # অন্যান্য দিনে আজকের তারিখ
         
-        fmt_date = save_date.strftime("%d-%b-%Y")
-        curr_time = now_bd.strftime("%H:%M")
+            fmt_date = save_date.strftime("%d-%b-%Y")
+            curr_time = now_bd.strftime("%H:%M")
         
-        payload = {
-            'action': 'save_update_delete', 'operation': '0', 'tot_row': str(len(b_data)),
-            'garments_nature': "'2'", 'cbo_company_name': f"'{cbo_logic}'", 'sewing_production_variable': "'3'",
-            'cbo_source': f"'{source}'",          
-            'cbo_emb_company': f"'{emb_company}'", 
-            'cbo_location': f"'{location}'",      
-            'cbo_floor': f"'{floor}'",            
-            'txt_issue_date': f"'{fmt_date}'", 'txt_organic': "''", 'txt_system_id': "''", 'delivery_basis': "'3'",
-            'txt_challan_no': "''", 
-            'cbo_line_no': f"'{line}'",           
-            'cbo_shift_name': "'0'",
-            'cbo_working_company_name': "'0'", 'cbo_working_location': "'0'", 
-            'txt_remarks': "''", 
-            'txt_reporting_hour': f"'{curr_time}'"
-        }
+            headers_save = headers_common.copy()
+            headers_save['Referer'] = MENU_REFERER
+            fields = {'company': cbo_logic, 'source': source, 'emb_company': emb_company, 'location': location,
+                      'floor': floor, 'line': line, 'date': fmt_date, 'time': curr_time}
 
-        for i, b in enumerate(b_data, 1):
-            payload[f'bundleNo_{i}'] = b['bundleNo']; payload[f'orderId_{i}'] = b['orderId']
-            payload[f'gmtsitemId_{i}'] = b['gmtsitemId']; payload[f'countryId_{i}'] = b['countryId']
-            payload[f'colorId_{i}'] = b['colorId']; payload[f'sizeId_{i}'] = b['sizeId']
-            payload[f'inseamId_{i}'] = '0'; payload[f'colorSizeId_{i}'] = b['colorSizeId']
-            payload[f'qty_{i}'] = b['qty']; payload[f'dtlsId_{i}'] = b['dtlsId']
-            payload[f'cutNo_{i}'] = b['cutNo']; payload[f'isRescan_{i}'] = b['isRescan']
-            payload[f'barcodeNo_{i}'] = b['barcodeNo']; payload[f'cutMstIdNo_{i}'] = '0'; payload[f'cutNumPrefixNo_{i}'] = '0'
-
-        headers_save = headers_common.copy()
-        headers_save['Referer'] = f"{base_url}/production/bundle_wise_sewing_input.php?permission=1_1_2_1"
-        
-        save_res = session.post(f"{base_url}/production/requires/bundle_wise_sewing_input_controller.php", data=payload, headers=headers_save)
+            if resume:
+                # Only the bundles a partial save left behind, onto the challan it created
+                pending = set(resume['barcodes'])
+                rows = [b for b in b_data if b.barcodeNo in pending]
+                if not rows: return {"status": "error", "message": "❌ Nothing Left To Resume"}
+                u1, u2 = report_urls(resume['system_id'])
+                result = {"status": "success", "challan_no": resume['challan_no'], "system_id": resume['system_id'], "report1_url": u1, "report2_url": u2}
+                return append_rows(session, fields, rows, result, headers_save, trace, len(b_data))
+
+            # With SAVE_CHUNK_SIZE set, only the first slice creates the challan; append_rows posts the rest
+            first = b_data[:SAVE_CHUNK_SIZE] if SAVE_CHUNK_SIZE else b_data
+            save_res = post_save(session, encode_save_body(save_header(fields), first), headers_save, trace)
         
-        if "**" in save_res.text:
-            parts = save_res.text.split('**')
-            code = parts[0].strip()
+            if "**" in save_res.text:
+                parts = save_res.text.split('**')
+                code = parts[0].strip()
             
-            if code == "0":
-                new_sys_id = parts[1]
-                new_challan = parts[2] if len(parts) > 2 else "Sewing Challan"
-                u1 = f"{base_url}/production/requires/bundle_wise_sewing_input_controller.php?data=1*{new_sys_id}*3*%E2%9D%8F%20Bundle%20Wise%20Sewing%20Input*1*undefined*undefined*undefined&action=emblishment_issue_print_13"
-                u2 = f"{base_url}/production/requires/bundle_wise_sewing_input_controller.php?data=1*{new_sys_id}*3*%E2%9D%8F%20Bundle%20Wise%20Sewing%20Input*undefined*undefined*undefined*1&action=sewing_input_challan_print_5"
-                return {"status": "success", "challan_no": new_challan, "system_id": new_sys_id, "report1_url": u1, "report2_url": u2}
-            elif code == "20": return {"status": "error", "message": "❌ Bundle Already Scanned!"}
-            elif code == "10": return {"status": "error", "message": "❌ Validation Error (10)."}
-            else: return {"status": "error", "message": f"Server Error Code: {code}"}
+                if code == "0":
+                    lookup_cache.delete(cache_key)
+                    new_sys_id = parts[1]
+                    new_challan = parts[2] if len(parts) > 2 else "Sewing Challan"
+                    u1, u2 = report_urls(new_sys_id)
+                    result = {"status": "success", "challan_no": new_challan, "system_id": new_sys_id, "report1_url": u1, "report2_url": u2}
+                    rest = b_data[len(first):]
+                    return append_rows(session, fields, rest, result, headers_save, trace, len(b_data)) if rest else result
+                elif code == "20": return {"status": "error", "message": "❌ Bundle Already Scanned!"}
+                elif code == "10": return {"status": "error", "message": "❌ Validation Error (10)."}
+                else: return {"status": "error", "message": f"Server Error Code: {code}"}
         
-        return {"status": "error", "message": f"Save Failed: {save_res.status_code}"}
+            return {"status": "error", "message": f"Save Failed: {save_res.status_code}"}
 
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        # Keep the stage and exception type so failures stay distinguishable
+        stage = trace.stages[-1][0] if trace.stages else 'init'
+        return {"status": "error", "message": str(e) or type(e).__name__, "stage": stage, "error_type": type(e).__name__}
 
 # --- ROUTES ---
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return INDEX_PAGE.response()
+
+@app.route('/sw.js')
+def service_worker():
+    return SW_PAGE.response()
 
 @app.route('/process', methods=['POST'])
 def process():
@@ -463,7 +913,134 @@ def process():
         return jsonify({"status": "error", "message": "Missing Data"})
     
     client_ua = request.headers.get('User-Agent')
-    return jsonify(process_data(data['challan'], client_ua, data['company_id']))
+    force = bool(data.get('force'))
+    # The system id of a partial save; the journal supplies the bundles it is missing
+    resume = data.get('resume')
+    if resume is not None:
+        if isinstance(resume, bool) or not RESUME_SYS_ID.match(str(resume)):
+            return jsonify({"status": "error", "message": "Invalid Resume (system id of a partial save expected)"}), 400
+        resume = str(resume)
+    if data.get('async') or request.args.get('async') == '1':
+        job_id = job_queue.submit(_process_job, data['challan'], client_ua, data['company_id'], force, resume)
+        return jsonify({"status": "queued", "job_id": job_id, "poll_url": f"/jobs/{job_id}", "events_url": f"/jobs/{job_id}/events",
+                        "max_wait": job_queue.max_runtime + JOB_POLL_MARGIN}), 202
+
+    trace = Trace()
+    resp = jsonify(process_data(data['challan'], client_ua, data['company_id'], trace, force, resume))
+    resp.headers['Server-Timing'] = trace.server_timing()
+    return resp
+
+def _process_job(challan, client_ua, company_id, force=False, resume=None):
+    trace = Trace()
+    result = process_data(challan, client_ua, company_id, trace, force, resume)
+    return {**result, "server_timing": trace.server_timing()}
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown Job"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    # Holds a connection while waiting, so only worth using with threaded workers
+    if job_queue.get(job_id) is None:
+        return jsonify({"status": "error", "message": "Unknown Job"}), 404
+
+    def generate():
+        last_state, last_sent = None, time.time()
+        stop_at = time.time() + SSE_MAX_SECONDS
+        while time.time() < stop_at:
+            job = job_queue.get(job_id) or {"job_id": job_id, "state": "expired"}
+            if job['state'] != last_state:
+                last_state, last_sent = job['state'], time.time()
+                event = 'done' if last_state in ('done', 'expired') else 'state'
+                yield f"event: {event}\ndata: {json.dumps(job)}\n\n"
+                if event == 'done': return
+            elif time.time() - last_sent > 15:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            time.sleep(0.25)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/history')
+def history():
+    # Served from the local journal only; never touches the ERP
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', HISTORY_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Bad Paging"}), 400
+    return jsonify(journal.history(page, per_page, request.args.get('q', '').strip() or None,
+                                   request.args.get('company_id'), request.args.get('status')))
+
+@app.route('/report/<sys_id>/<kind>')
+def report(sys_id, kind):
+    # Only challans saved through this portal: the ERP login behind it could print any
+    if not reports.valid(sys_id, kind) or not journal.has_system_id(sys_id):
+        return jsonify({"status": "error", "message": "Unknown Report"}), 404
+    try:
+        body = reports.get(sys_id, kind, request.headers.get('User-Agent'))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e) or type(e).__name__}), 502
+    headers = {'Cache-Control': 'private, max-age=3600', 'Vary': 'Accept-Encoding'}
+    if 'gzip' in request.accept_encodings:
+        headers['Content-Encoding'] = 'gzip'
+    else:
+        body = gzip.decompress(body)
+    return Response(body, mimetype='text/html', headers=headers)
+
+@app.route('/ready')
+def ready():
+    # For the load balancer: a worker only takes traffic once its ERP sessions are logged in
+    if not warm.is_set():
+        return jsonify({"status": "warming"}), 503
+    return jsonify({"status": "ready"})
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch():
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else data
+    if not items or not isinstance(items, list):
+        return jsonify({"status": "error", "message": "Missing Data"})
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"status": "error", "message": f"Too Many Items (max {BATCH_MAX_ITEMS})"}), 400
+    if any(not isinstance(it, dict) or 'challan' not in it or 'company_id' not in it for it in items):
+        return jsonify({"status": "error", "message": "Missing Data"})
+
+    concurrency = data.get('concurrency', BATCH_CONCURRENCY) if isinstance(data, dict) else BATCH_CONCURRENCY
+    try:
+        if isinstance(concurrency, bool):
+            raise ValueError
+        concurrency = int(concurrency)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "Invalid Concurrency (whole number expected)"}), 400
+    # More threads than pooled sessions would only queue on checkout
+    concurrency = max(1, min(concurrency, BATCH_CONCURRENCY, erp_pool.size))
+    client_ua = request.headers.get('User-Agent')
+
+    def generate():
+        ok = 0
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+        try:
+            futures = {executor.submit(process_data, it['challan'], client_ua, it['company_id']): i for i, it in enumerate(items)}
+            for fut in as_completed(futures):
+                i = futures[fut]
+                res = fut.result()
+                if res.get('status') == 'success': ok += 1
+                yield json.dumps({"index": i, "challan": items[i]['challan'], "company_id": items[i]['company_id'], **res}) + "\n"
+            yield json.dumps({"status": "done", "total": len(items), "success": ok, "failed": len(items) - ok}) + "\n"
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
 
 if __name__ == "__main__":
+    warm_up()
     app.run(host='0.0.0.0', port=10000)
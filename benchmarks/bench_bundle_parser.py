@@ -0,0 +1,100 @@
+"""Micro-benchmark: legacy per-row regex loop vs bundle_parser.iter_bundle_rows.
+
+    python benchmarks/bench_bundle_parser.py [--repeat N]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bundle_parser import FIELDS, iter_bundle_rows  # noqa: E402
+
+# The table reaches iter_bundle_rows as decoded pieces of erp_session.STREAM_CHUNK bytes
+PIECE = 16384
+
+ROW = (
+    '<tr id="tr_{i}" align="center" valign="middle">'
+    '<td width="30">{i}</td>'
+    '<td width="100" id="bundle_{i}" title="{barcode}">MNM-{cut}-{i}</td>'
+    '<td width="80">{cut}</td><td width="90">Navy Blue</td><td width="50">XL</td>'
+    '<td width="60" align="right">{qty}'
+    '<input type="hidden" name="orderId[]" id="orderId_{i}" value="{order}"/>'
+    '<input type="hidden" name="gmtsitemId[]" id="gmtsitemId_{i}" value="3"/>'
+    '<input type="hidden" name="countryId[]" id="countryId_{i}" value="12"/>'
+    '<input type="hidden" name="colorId[]" id="colorId_{i}" value="{color}"/>'
+    '<input type="hidden" name="sizeId[]" id="sizeId_{i}" value="7"/>'
+    '<input type="hidden" name="colorSizeId[]" id="colorSizeId_{i}" value="{cs}"/>'
+    '<input type="hidden" name="qty[]" id="qty_{i}" value="{qty}"/>'
+    '<input type="hidden" name="dtlsId[]" id="dtlsId_{i}" value="{dtls}"/>'
+    '<input type="hidden" name="cutNo[]" id="cutNo_{i}" value="CC-{cut}"/>'
+    '<input type="hidden" name="isRescan[]" id="isRescan_{i}" value="0"/>'
+    '</td></tr>\n'
+)
+
+
+def make_table(n, barcode_base=190000000):
+    head = '<table class="rpt_table" id="tbl_details"><thead><tr><th>SL</th><th>Bundle</th></tr></thead><tbody>\n'
+    body = ''.join(ROW.format(i=i, barcode=barcode_base + i, cut=100 + i // 50, qty=10 + i % 15, order=5500 + i % 3,
+                              color=40 + i % 5, cs=880000 + i, dtls=770000 + i) for i in range(1, n + 1))
+    return head + body + '</tbody></table>'
+
+
+def legacy_parse(text):
+    # Copy of the loop process_data used before bundle_parser existed
+    rows = text.split('<tr')
+    b_data = []
+    for r in rows:
+        if 'id="tr_' not in r: continue
+        def get_row_val(pat, txt):
+            m = re.search(pat, txt)
+            return m.group(1) if m else '0'
+
+        b_data.append({
+            'barcodeNo': get_row_val(r"title=\"(\d+)\"", r),
+            'bundleNo': get_row_val(r"id=\"bundle_\d+\"[^>]*>([^<]+)", r),
+            'orderId': get_row_val(r"name=\"orderId\[\]\".*?value=\"(\d+)\"", r),
+            'gmtsitemId': get_row_val(r"name=\"gmtsitemId\[\]\".*?value=\"(\d+)\"", r),
+            'countryId': get_row_val(r"name=\"countryId\[\]\".*?value=\"(\d+)\"", r),
+            'colorId': get_row_val(r"name=\"colorId\[\]\".*?value=\"(\d+)\"", r),
+            'sizeId': get_row_val(r"name=\"sizeId\[\]\".*?value=\"(\d+)\"", r),
+            'colorSizeId': get_row_val(r"name=\"colorSizeId\[\]\".*?value=\"(\d+)\"", r),
+            'qty': get_row_val(r"name=\"qty\[\]\".*?value=\"(\d+)\"", r),
+            'dtlsId': get_row_val(r"name=\"dtlsId\[\]\".*?value=\"(\d+)\"", r),
+            'cutNo': get_row_val(r"name=\"cutNo\[\]\".*?value=\"([^\"]+)\"", r),
+            'isRescan': get_row_val(r"name=\"isRescan\[\]\".*?value=\"(\d+)\"", r)
+        })
+    return b_data
+
+
+def split_pieces(text):
+    return [text[i:i + PIECE] for i in range(0, len(text), PIECE)]
+
+
+def streamed_parse(pieces):
+    return list(iter_bundle_rows(pieces))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'rows':>6} {'legacy ms':>11} {'parser ms':>11} {'speedup':>8}")
+    for n in (10, 100, 1000, 5000):
+        text = make_table(n)
+        pieces = split_pieces(text)
+        expected = legacy_parse(text)
+        got = [{f: getattr(r, f) for f in FIELDS} for r in streamed_parse(pieces)]
+        assert got == expected, f"parser output differs from legacy at {n} rows"
+
+        number = max(1, 2000 // n)
+        t_old = min(timeit.repeat(lambda: legacy_parse(text), number=number, repeat=args.repeat)) / number
+        t_new = min(timeit.repeat(lambda: streamed_parse(pieces), number=number, repeat=args.repeat)) / number
+        print(f"{n:>6} {t_old * 1e3:>11.3f} {t_new * 1e3:>11.3f} {t_old / t_new:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
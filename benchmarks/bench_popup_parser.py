@@ -0,0 +1,65 @@
+"""Micro-benchmark: five legacy get_val scans vs popup_parser.popup_values.
+
+    python benchmarks/bench_popup_parser.py [--repeat N]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from popup_parser import POPUP_FIELDS, parse_popup, popup_values  # noqa: E402
+
+# A populate_data_from_challan_popup body is a long run of field assignments and
+# drop-down reloads; the fields process_data needs sit among them.
+FILLER = (
+    "$('#txt_field_{i}').val('{i}');\n"
+    "load_drop_down( 'requires/bundle_wise_sewing_input_controller', '{i}_2', 'load_drop_down_item_{i}', 'item_td_{i}' );\n"
+    "document.getElementById('hidden_field_{i}').value = 'value {i}';\n"
+    "$('#cbo_extra_{i}').attr('disabled', true);\n"
+)
+FIELDS = "$('#cbo_source').val('1');\n$('#cbo_emb_company').val('2');\n$('#cbo_location').val('3');\n"
+TAIL = "$('#cbo_floor').val('12');\n$('#cbo_line_no').val('27');\nset_button_status(1, permission, 'fnc_sewing_input', 1);\n"
+
+
+def make_popup(n):
+    head = ''.join(FILLER.format(i=i) for i in range(n // 2))
+    mid = ''.join(FILLER.format(i=i) for i in range(n // 2, n))
+    return head + FIELDS + mid + TAIL
+
+
+def legacy_values(text):
+    # Copy of the nested helper process_data used before popup_parser existed
+    def get_val(id_name, text):
+        pattern = re.escape(id_name) + r".*?\.val\(\s*['\"]?([^'\")]+)['\"]?\s*\)"
+        m = re.search(pattern, text)
+        return m.group(1).strip() if m else '0'
+
+    return {name: get_val(name, text) for name in POPUP_FIELDS}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'lines':>6} {'bytes':>8} {'legacy us':>11} {'parser us':>11} {'speedup':>8} {'all fields us':>14}")
+    for n in (10, 50, 200, 1000):
+        text = make_popup(n)
+        expected = legacy_values(text)
+        got = popup_values(text)
+        assert {k: got[k] for k in POPUP_FIELDS} == expected, f"parser output differs from legacy at {n} lines"
+        every = parse_popup(text, names=None)
+        assert all(every[k] == expected[k] for k in POPUP_FIELDS) and 'txt_field_0' in every
+
+        number = max(1, 20000 // n)
+        t_old = min(timeit.repeat(lambda: legacy_values(text), number=number, repeat=args.repeat)) / number
+        t_new = min(timeit.repeat(lambda: popup_values(text), number=number, repeat=args.repeat)) / number
+        t_all = min(timeit.repeat(lambda: parse_popup(text, names=None), number=number, repeat=args.repeat)) / number
+        print(f"{n * 4:>6} {len(text):>8} {t_old * 1e6:>11.1f} {t_new * 1e6:>11.1f} {t_old / t_new:>7.1f}x {t_all * 1e6:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
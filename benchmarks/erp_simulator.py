@@ -0,0 +1,191 @@
+"""Local stand-in for the ERP controllers process_data talks to.
+
+Never load-test the production ERP; run this instead and point the service
+at it with ERP_BASE_URL=http://127.0.0.1:8022/erp.
+
+    python benchmarks/erp_simulator.py --port 8022 --latency 0.08 --bundles 60
+"""
+import argparse
+import http.server
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_bundle_parser import make_table  # noqa: E402
+
+LOGIN_PAGE = ('<html><body><form action="login.php" method="post">'
+              '<input type="text" name="txt_userid"><input type="password" name="txt_password">'
+              '</form></body></html>')
+
+POPUP = ("$('#txt_challan_no').val('{challan}');\n$('#cbo_company_name').val('{company}');\n"
+         "$('#cbo_source').val('1');\n$('#cbo_emb_company').val('{company}');\n"
+         "$('#cbo_location').val('3');\n$('#cbo_floor').val('12');\n$('#cbo_line_no').val('{line}');\n"
+         "$('#txt_remarks').val('');\n")
+
+REPORT = '<html><head><link rel="stylesheet" href="../../css/style.css"></head><body><h3>{kind}</h3>{table}</body></html>'
+
+
+class Config:
+    latency = 0.05          # mean seconds added to every call
+    jitter = 0.5            # +/- fraction of latency
+    bundles = 40            # rows returned by populate_bundle_data_update
+    http_error_rate = 0.0   # share of calls answered with 429/5xx
+    dup_rate = 0.0          # share of saves answered with code 20
+    validation_rate = 0.0   # share of saves answered with code 10
+    invalid_rate = 0.0      # share of searches that find no challan
+    session_ttl = 1440
+    # ASSUMPTION, not observed on the live ERP: a save with operation=1 adds its
+    # rows to txt_system_id's challan and answers 1**. Off, it is answered like a
+    # new challan, which app.append_rows treats as not appended.
+    assume_append = False
+
+
+class State:
+    lock = threading.Lock()
+    sessions = {}
+    saved = set()
+    ids = itertools.count(500000)
+    calls = {}
+
+
+def sys_id_for(challan):
+    return str(100000 + int(challan) % 900000) if challan.isdigit() else '100000'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without this, delayed ACKs add ~40 ms per call
+    disable_nagle_algorithm = True
+    cfg = Config
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_call()
+
+    def do_POST(self):
+        self.handle_call()
+
+    def reply(self, status=200, body='', headers=None):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def session_ok(self):
+        cookie = self.headers.get('Cookie', '')
+        sid = next((c.split('=', 1)[1] for c in cookie.split('; ') if c.startswith('PHPSESSID=')), None)
+        with State.lock:
+            started = State.sessions.get(sid)
+        return started is not None and time.time() - started < self.cfg.session_ttl
+
+    def handle_call(self):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode(), keep_blank_values=True).items()} if length else {}
+        action = query.get('action') or form.get('action') or url.path.rsplit('/', 1)[-1]
+        with State.lock:
+            State.calls[action] = State.calls.get(action, 0) + 1
+
+        cfg = self.cfg
+        time.sleep(max(0.0, cfg.latency * (1 + random.uniform(-cfg.jitter, cfg.jitter))))
+        if cfg.http_error_rate and random.random() < cfg.http_error_rate:
+            return self.reply(random.choice((429, 500, 502, 503, 504)), 'busy')
+
+        if url.path.endswith('/login.php'):
+            sid = uuid.uuid4().hex
+            with State.lock:
+                State.sessions[sid] = time.time()
+            return self.reply(200, '<html>welcome</html>', {'Set-Cookie': f'PHPSESSID={sid}; path=/'})
+        if url.path.endswith('/stats'):
+            with State.lock:
+                return self.reply(200, repr(dict(State.calls)))
+        if not self.session_ok():
+            return self.reply(200, LOGIN_PAGE)
+
+        if url.path.endswith('valid_user_action.php') or url.path.endswith('common_functions_for_js.php'):
+            return self.reply(200, '1')
+        if url.path.endswith('bundle_wise_cutting_delevar_to_input_controller.php'):
+            return self.cutting_controller(action, query.get('data', ''))
+        if url.path.endswith('bundle_wise_sewing_input_controller.php'):
+            return self.sewing_controller(action, query, form)
+        self.reply(404, 'not found')
+
+    def cutting_controller(self, action, data):
+        cfg = self.cfg
+        if action == 'create_challan_search_list_view':
+            challan, company = data.split('_')[0], (data.split('_') + [''] * 4)[3]
+            if cfg.invalid_rate and random.random() < cfg.invalid_rate:
+                return self.reply(200, '<table><tr><td>No data found</td></tr></table>')
+            sid = sys_id_for(challan)
+            return self.reply(200, f'<table><tr onclick="js_set_value({sid})"><td>{challan}</td><td>{company}</td></tr></table>')
+        if action == 'populate_data_from_challan_popup':
+            return self.reply(200, POPUP.format(challan=data, company=2, line=int(data) % 40 + 1 if data.isdigit() else 1))
+        if action == 'bundle_nos':
+            return self.reply(200, ','.join(f"B{data}-{i}" for i in range(1, cfg.bundles + 1)) + '**1')
+        if action == 'populate_bundle_data_update':
+            sid = (data.split('**') + [''] * 3)[2]
+            return self.reply(200, make_table(cfg.bundles, int(sid) * 10000 if sid.isdigit() else 190000000))
+        self.reply(200, '')
+
+    def sewing_controller(self, action, query, form):
+        cfg = self.cfg
+        if action == 'save_update_delete':
+            key = tuple(sorted(v for k, v in form.items() if k.startswith('barcodeNo_')))
+            r = random.random()
+            with State.lock:
+                dup = key in State.saved
+                if not dup and r >= cfg.validation_rate:
+                    State.saved.add(key)
+                new_id = next(State.ids)
+            if dup or r < cfg.dup_rate:
+                return self.reply(200, '20**0')
+            if r < cfg.dup_rate + cfg.validation_rate:
+                return self.reply(200, '10**0')
+            if cfg.assume_append and form.get('operation') == '1':
+                sid = form.get('txt_system_id', '').strip("'")
+                return self.reply(200, f'1**{sid}**MNM-SWI-{sid}')
+            return self.reply(200, f'0**{new_id}**MNM-SWI-{new_id}')
+        if action in ('emblishment_issue_print_13', 'sewing_input_challan_print_5'):
+            return self.reply(200, REPORT.format(kind=action, table=make_table(cfg.bundles)))
+        self.reply(200, '')
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8022)
+    for name in ('latency', 'jitter', 'http_error_rate', 'dup_rate', 'validation_rate', 'invalid_rate'):
+        ap.add_argument('--' + name.replace('_', '-'), type=float, default=getattr(Config, name))
+    ap.add_argument('--bundles', type=int, default=Config.bundles)
+    ap.add_argument('--session-ttl', type=int, default=Config.session_ttl)
+    ap.add_argument('--assume-append', action='store_true',
+                    help='answer operation=1 saves as appends (unverified against the real ERP; for SAVE_CHUNK_SIZE runs)')
+    args = ap.parse_args()
+    for k, v in vars(args).items():
+        if hasattr(Config, k): setattr(Config, k, v)
+
+    server = http.server.ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"ERP simulator on http://{args.host}:{args.port}/erp", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Drive /process under gunicorn against the ERP simulator at rising concurrency.
+
+    python benchmarks/loadtest.py --levels 1,4,8,16 --duration 20 --workers 4
+    python benchmarks/loadtest.py --target http://127.0.0.1:10000   # already running service
+
+Reports req/s, latency percentiles and a per-stage breakdown taken from the
+Server-Timing header, so before/after runs can be compared directly.
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def parse_server_timing(header):
+    out = {}
+    for part in header.split(','):
+        name, _, rest = part.strip().partition(';')
+        if rest.startswith('dur='):
+            out[name] = out.get(name, 0.0) + float(rest[4:]) / 1000
+    return out
+
+
+def wait_for(url, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up")
+
+
+def run_level(target, concurrency, duration, challans):
+    lock = threading.Lock()
+    latencies, stages, outcomes = [], {}, {}
+    stop_at = time.time() + duration
+
+    def worker():
+        http = requests.Session()
+        while time.time() < stop_at:
+            # force: a repeat challan would otherwise be answered from the journal
+            body = {'challan': str(random.choice(challans)), 'company_id': random.choice('1234'), 'force': True}
+            t0 = time.perf_counter()
+            try:
+                res = http.post(f"{target}/process", json=body, timeout=60)
+                status = res.json().get('status', 'error')
+                timing = parse_server_timing(res.headers.get('Server-Timing', ''))
+            except (requests.RequestException, ValueError):
+                status, timing = 'transport_error', {}
+            dt = time.perf_counter() - t0
+            with lock:
+                latencies.append(dt)
+                outcomes[status] = outcomes.get(status, 0) + 1
+                for name, d in timing.items():
+                    stages.setdefault(name, []).append(d)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+    return latencies, stages, outcomes, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--target', help='base URL of a running service; default starts gunicorn + simulator')
+    ap.add_argument('--levels', default='1,2,4,8,16,32')
+    ap.add_argument('--duration', type=float, default=15)
+    ap.add_argument('--workers', type=int, default=4)
+    ap.add_argument('--threads', type=int, default=8)
+    ap.add_argument('--port', type=int, default=10100)
+    ap.add_argument('--erp-port', type=int, default=8099)
+    ap.add_argument('--challans', type=int, default=5000, help='size of the random challan id space')
+    ap.add_argument('sim_args', nargs='*', help='extra erp_simulator.py flags after --, e.g. -- --latency 0.1')
+    args = ap.parse_args()
+
+    procs = []
+    scratch = None
+    target = args.target
+    if not target:
+        erp = f"http://127.0.0.1:{args.erp_port}"
+        procs.append(subprocess.Popen([sys.executable, os.path.join(HERE, 'erp_simulator.py'), '--port', str(args.erp_port)] + args.sim_args))
+        wait_for(f"{erp}/erp/stats")
+        scratch = tempfile.mkdtemp(prefix='challan-loadtest-')
+        env = dict(os.environ, ERP_BASE_URL=f"{erp}/erp", JOURNAL_DB=os.path.join(scratch, 'journal.sqlite3'),
+                   METRICS_DIR=os.path.join(scratch, 'metrics'))
+        procs.append(subprocess.Popen(['gunicorn', '-w', str(args.workers), '--threads', str(args.threads),
+                                       '-b', f"127.0.0.1:{args.port}", 'app:app'], cwd=ROOT, env=env))
+        target = f"http://127.0.0.1:{args.port}"
+        wait_for(f"{target}/metrics")
+
+    challans = [random.randint(10000, 99999) for _ in range(args.challans)]
+    try:
+        print(f"{'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  outcomes")
+        for level in (int(x) for x in args.levels.split(',')):
+            latencies, stages, outcomes, elapsed = run_level(target, level, args.duration, challans)
+            ms = [x * 1000 for x in latencies]
+            print(f"{level:>5} {len(latencies) / elapsed:>8.1f} {percentile(ms, 50):>8.0f} {percentile(ms, 95):>8.0f} "
+                  f"{percentile(ms, 99):>8.0f}  {outcomes}")
+            for name, vals in sorted(stages.items(), key=lambda kv: -sum(kv[1])):
+                vals_ms = [v * 1000 for v in vals]
+                print(f"{'':>5}   {name:<14} mean {sum(vals_ms) / len(vals_ms):>7.1f} ms   p95 {percentile(vals_ms, 95):>7.1f} ms   n={len(vals)}")
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            p.wait()
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
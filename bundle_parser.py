@@ -0,0 +1,60 @@
+import re
+
+# --- BUNDLE TABLE PARSER (populate_bundle_data_update) ---
+FIELDS = ('barcodeNo', 'bundleNo', 'orderId', 'gmtsitemId', 'countryId', 'colorId',
+          'sizeId', 'colorSizeId', 'qty', 'dtlsId', 'cutNo', 'isRescan')
+
+_INPUT_FIELDS = FIELDS[2:]
+
+# Every pattern starts with a literal so the regex engine can skip ahead with a
+# fast substring search; the greedy `[^>]*` keeps name/value inside one tag.
+_BARCODE = re.compile(r'title="(\d+)"')
+_BUNDLE = re.compile(r'id="bundle_\d+"[^>]*>([^<]+)')
+_INPUTS = re.compile(r'name="(\w+)\[\]"[^>]*value="([^"]*)"')
+
+
+class BundleRow:
+    __slots__ = FIELDS
+
+    def __init__(self, values):
+        for f, v in zip(FIELDS, values):
+            setattr(self, f, v)
+
+    def __repr__(self):
+        return f"BundleRow({', '.join(f'{f}={getattr(self, f)!r}' for f in FIELDS)})"
+
+
+def parse_bundle_row(chunk):
+    """Parse one `<tr` chunk; missing fields come back as '0' like the ERP form expects."""
+    m = _BARCODE.search(chunk)
+    barcode = m.group(1) if m else '0'
+    m = _BUNDLE.search(chunk)
+    bundle = m.group(1) if m else '0'
+    # reversed() so the first input of each name wins, as with re.search
+    inputs = dict(reversed(_INPUTS.findall(chunk)))
+    values = [barcode, bundle]
+    for f in _INPUT_FIELDS:
+        v = inputs.get(f)
+        values.append(v if v and (f == 'cutNo' or v.isdigit()) else '0')
+    return BundleRow(values)
+
+
+def iter_bundle_rows(pieces):
+    """Yield a BundleRow per `<tr id="tr_...">` as text pieces arrive.
+
+    Only the current, unfinished row is buffered, so a streamed table never has
+    to be held in memory as a whole.
+    """
+    buf = ''
+    for piece in pieces:
+        buf += piece
+        end = buf.rfind('<tr')
+        if end <= 0:
+            continue
+        for chunk in buf[:end].split('<tr'):
+            if 'id="tr_' in chunk:
+                yield parse_bundle_row(chunk)
+        buf = buf[end:]
+    for chunk in buf.split('<tr'):
+        if 'id="tr_' in chunk:
+            yield parse_bundle_row(chunk)
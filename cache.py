@@ -0,0 +1,111 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Counter
+
+# --- CHALLAN LOOKUP CACHE ---
+CACHE_TTL = int(os.environ.get("CHALLAN_CACHE_TTL", "300"))
+CACHE_SIZE = int(os.environ.get("CHALLAN_CACHE_SIZE", "512"))
+# Optional SQLite file shared by every gunicorn worker on the host
+CACHE_DB = os.environ.get("CHALLAN_CACHE_DB")
+
+CACHE_EVENTS = Counter("challan_cache_total", "Challan lookup cache hits and misses.", ("result",))
+
+
+class SqliteStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_prune = 0.0
+
+    def _conn(self):
+        # Per thread and per pid, opened on first use: a connection must not cross
+        # a fork, and with --preload this module is imported in the master
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None, 0
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires):
+        self._conn().execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, json.dumps(value), expires))
+        self._prune()
+
+    def _prune(self):
+        # Expired rows are never read again; without this the file only grows
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        self._conn().execute("DELETE FROM cache WHERE expires < ?", (now,))
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class TTLCache:
+    """Bounded LRU with per-entry TTL, optionally backed by a shared SqliteStore."""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, shared_path=CACHE_DB):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared = SqliteStore(shared_path) if shared_path else None
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > now:
+                self._data.move_to_end(key)
+                CACHE_EVENTS.inc('hit')
+                return item[0]
+            self._data.pop(key, None)
+        if self._shared is not None:
+            try:
+                value, expires = self._shared.get(key)
+            except sqlite3.Error:
+                value = None
+            if value is not None:
+                self._put(key, value, expires)
+                CACHE_EVENTS.inc('hit')
+                return value
+        CACHE_EVENTS.inc('miss')
+        return None
+
+    def _put(self, key, value, expires):
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl
+        self._put(key, value, expires)
+        if self._shared is not None:
+            try:
+                self._shared.set(key, value, expires)
+            except sqlite3.Error:
+                pass
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self._shared is not None:
+            try:
+                self._shared.delete(key)
+            except sqlite3.Error:
+                pass
@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# --- REQUEST DEADLINE ---
+DEADLINE_SECONDS = float(os.environ.get("ERP_DEADLINE", "15"))
+CONNECT_TIMEOUT = float(os.environ.get("ERP_CONNECT_TIMEOUT", "3"))
+MIN_STAGE_TIMEOUT = 1.0
+# Seconds held back per unit of weight for stages that still have to run
+RESERVE_PER_WEIGHT = 0.6
+
+STAGE_WEIGHTS = {'login': 1, 'menu_valid': 0.5, 'menu_session': 0.5, 'search': 1, 'popup': 1,
+                 'bundle_nos': 1, 'bundle_table': 2, 'save': 3}
+PIPELINE = ('search', 'popup', 'bundle_nos', 'bundle_table', 'save')
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, total=DEADLINE_SECONDS):
+        self.expires = time.monotonic() + total
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+    def timeout(self, stage):
+        """(connect, read) timeout for `stage`, leaving room for the stages after it."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"⏱️ ERP Timeout ({stage})")
+        later = PIPELINE[PIPELINE.index(stage) + 1:] if stage in PIPELINE else PIPELINE
+        reserve = sum(STAGE_WEIGHTS[s] for s in later) * RESERVE_PER_WEIGHT
+        read = min(remaining, max(MIN_STAGE_TIMEOUT, remaining - reserve))
+        return min(CONNECT_TIMEOUT, read), read
+
+
+# The deadline follows the request through the session pool and the retry
+# adapter without widening every signature; hedge threads re-bind it.
+_local = threading.local()
+
+
+def current_deadline():
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def bind_deadline(deadline):
+    prev = current_deadline()
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = prev
+
+
+class LatencyWindow:
+    """Recent latencies per stage, used to decide when a lookup is worth hedging."""
+
+    def __init__(self, size=200, min_samples=20):
+        self.size, self.min_samples = size, min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.size)).append(seconds)
+
+    def p95(self, stage):
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[-(-len(samples) * 95 // 100) - 1]
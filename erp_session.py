@@ -0,0 +1,496 @@
+import codecs
+import os
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.exceptions import MaxRetryError, ReadTimeoutError
+from urllib3.util.retry import Retry
+
+from admission import ADMISSION
+from deadline import DeadlineExceeded, LatencyWindow, bind_deadline, current_deadline
+from metrics import RESPONSE_BYTES, Trace
+
+# --- ERP CONNECTION ---
+# ERP_BASE_URL lets benchmarks point the service at benchmarks/erp_simulator.py
+BASE_URL = os.environ.get("ERP_BASE_URL", "http://180.92.235.190:8022/erp").rstrip('/')
+ORIGIN = "{0.scheme}://{0.netloc}/".format(urlsplit(BASE_URL))
+LOGIN_URL = f"{BASE_URL}/login.php"
+MENU_REFERER = f"{BASE_URL}/production/bundle_wise_sewing_input.php?permission=1_1_2_1"
+MENU_URLS = (
+    f"{BASE_URL}/tools/valid_user_action.php?menuid=724",
+    f"{BASE_URL}/includes/common_functions_for_js.php?data=724_7_406&action=create_menu_session",
+)
+SAVE_URL = f"{BASE_URL}/production/requires/bundle_wise_sewing_input_controller.php"
+CREDENTIALS = {'txt_userid': 'input1.clothing-cutting', 'txt_password': '123456', 'submit': 'Login'}
+DEFAULT_UA = 'Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Mobile Safari/537.36'
+
+# Sessions per gunicorn worker; PHP drops idle sessions after 1440s by default,
+# so we log in again a little before that instead of waiting for a bounce.
+POOL_SIZE = int(os.environ.get("ERP_POOL_SIZE", "4"))
+SESSION_MAX_AGE = int(os.environ.get("ERP_SESSION_MAX_AGE", "1200"))
+CHECKOUT_TIMEOUT = int(os.environ.get("ERP_CHECKOUT_TIMEOUT", "30"))
+# Idle sessions are pinged this often so PHP and the keep-alive sockets don't drop them
+HEARTBEAT_INTERVAL = int(os.environ.get("ERP_HEARTBEAT", "300"))
+
+# Read-only lookups that may be duplicated when they run past their p95
+HEDGE_STAGES = {'search', 'bundle_nos', 'bundle_table'}
+STAGE_LATENCY = LatencyWindow()
+_hedge_executor = ThreadPoolExecutor(max_workers=POOL_SIZE * 2, thread_name_prefix="hedge")
+
+# Streamed bodies are read in STREAM_CHUNK pieces; when a reader stops early, a
+# tail up to DRAIN_LIMIT is drained so the keep-alive connection can be reused.
+STREAM_CHUNK = 16384
+DRAIN_LIMIT = 65536
+
+
+class SessionExpired(Exception):
+    pass
+
+
+class HedgeLost(Exception):
+    """The call was cut short because its hedge answered first."""
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def erp_headers(client_ua=None):
+    return {
+        'User-Agent': client_ua if client_ua else DEFAULT_UA,
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Origin': ORIGIN,
+        'Referer': LOGIN_URL
+    }
+
+
+class DeadlineRetry(Retry):
+    """Retry that gives up instead of backing off past the request deadline.
+
+    Each retry also goes through admission control, so a slow ERP is not hit by
+    every worker's retries at once.
+    """
+
+    def increment(self, *args, **kwargs):
+        if threading.get_ident() in _cancelled:
+            raise MaxRetryError(kwargs.get('_pool'), kwargs.get('url'), kwargs.get('error'))
+        new = super().increment(*args, **kwargs)
+        deadline = current_deadline()
+        if deadline is not None and deadline.remaining() <= new.get_backoff_time():
+            raise MaxRetryError(kwargs.get('_pool'), kwargs.get('url'), kwargs.get('error'))
+        if not ADMISSION.allow_retry():
+            raise MaxRetryError(kwargs.get('_pool'), kwargs.get('url'), kwargs.get('error'))
+        return new
+
+
+# --- HEDGE CANCELLATION ---
+# The connection each thread is waiting on for response headers, so a hedge that
+# answers first can shut the primary's socket and free its session.
+_waiting = {}
+_cancelled = set()
+
+
+class _TrackedConnection(HTTPConnection):
+    def request(self, *args, **kwargs):
+        _waiting[threading.get_ident()] = self
+        try:
+            super().request(*args, **kwargs)
+        except BaseException:
+            _waiting.pop(threading.get_ident(), None)
+            raise
+
+    def getresponse(self, *args, **kwargs):
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            _waiting.pop(threading.get_ident(), None)
+
+
+class _TrackedPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedConnection
+
+
+class ErpAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {**self.poolmanager.pool_classes_by_scheme, 'http': _TrackedPool}
+
+
+def _cancel(thread_id):
+    _cancelled.add(thread_id)
+    sock = getattr(_waiting.get(thread_id), 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _Race:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.primary_done = threading.Event()
+        self.primary = None  # None while running, then 'ok' or 'failed'
+        self.winner = None
+
+
+def is_expired(res, text=None):
+    # The ERP bounces unauthenticated calls back to the login form
+    if res.status_code in (401, 403) or res.url.split('?')[0].endswith('/login.php'):
+        return True
+    return 'name="txt_password"' in (res.text if text is None else text)
+
+
+class ErpStream:
+    """A streamed ERP response, iterated as decoded text pieces.
+
+    The first piece is read up front so a bounce to the login form is still
+    noticed. Use it as a context manager, or call close(), to release the connection.
+    """
+
+    def __init__(self, res, stage, trace):
+        self.res, self.stage, self.trace = res, stage, trace
+        self.bytes = 0
+        self.on_close = None
+        self._closed = False
+        self._timer = None
+        self._pieces = self._read()
+        self.first = next(self._pieces, '')
+
+    def _read(self):
+        decoder = codecs.getincrementaldecoder(self.res.encoding or 'utf-8')(errors='replace')
+        deadline = current_deadline()
+        try:
+            for block in self.res.iter_content(STREAM_CHUNK):
+                self.bytes += len(block)
+                text = decoder.decode(block)
+                if text:
+                    yield text
+                if deadline is not None and deadline.remaining() <= 0:
+                    raise DeadlineExceeded(f"⏱️ ERP Timeout ({self.stage})")
+        except requests.ConnectionError as e:
+            if e.args and isinstance(e.args[0], ReadTimeoutError):
+                raise DeadlineExceeded(f"⏱️ ERP Timeout ({self.stage})") from e
+            raise
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+    def expired(self):
+        return is_expired(self.res, self.first)
+
+    def __iter__(self):
+        if self.first:
+            first, self.first = self.first, ''
+            yield first
+        yield from self._pieces
+
+    def search(self, pattern, overlap=256):
+        """First match of `pattern`, reading no further than needed."""
+        buf = ''
+        for piece in self:
+            buf = buf[-overlap:] + piece
+            m = pattern.search(buf)
+            if m:
+                return m
+        return None
+
+    def read_until(self, sep):
+        """Text before the first `sep` (all of it if there is none)."""
+        parts, carry, keep = [], '', len(sep) - 1
+        for piece in self:
+            buf = carry + piece
+            i = buf.find(sep)
+            if i >= 0:
+                parts.append(buf[:i])
+                return ''.join(parts)
+            cut = max(0, len(buf) - keep)
+            parts.append(buf[:cut])
+            carry = buf[cut:]
+        parts.append(carry)
+        return ''.join(parts)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        start = self.bytes
+        try:
+            for _ in self._pieces:
+                if self.bytes - start > DRAIN_LIMIT:
+                    break
+        except Exception:
+            pass
+        finally:
+            # Fully read responses go back to the pool; anything else drops its socket
+            self.res.close()
+            RESPONSE_BYTES.observe(self.bytes, self.stage)
+            if self.on_close is not None:
+                self.on_close()
+
+    def __enter__(self):
+        self._timer = self.trace.stage(f"{self.stage}_body")
+        self._timer.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.close()
+        finally:
+            self._timer.__exit__(*exc)
+        return False
+
+
+class ErpSession:
+    """A logged-in, menu-activated ERP session with its own keep-alive connections."""
+
+    def __init__(self):
+        self.http = requests.Session()
+        retry = DeadlineRetry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+        self.http.mount("http://", ErpAdapter(max_retries=retry, pool_connections=1, pool_maxsize=2))
+        # The save is not idempotent: only retry when the connection never opened
+        no_replay = Retry(total=1, connect=1, read=0, status=0, other=0)
+        self.http.mount(SAVE_URL, HTTPAdapter(max_retries=no_replay, pool_connections=1, pool_maxsize=1))
+        self.logged_in_at = 0.0
+        self.last_used = 0.0
+
+    @property
+    def stale(self):
+        return time.time() - self.logged_in_at > SESSION_MAX_AGE
+
+    def _send(self, trace, stage, method, url, **kwargs):
+        deadline = current_deadline()
+        if deadline is not None and 'timeout' not in kwargs:
+            kwargs['timeout'] = deadline.timeout(stage)
+        def http(*args, **kw):
+            try:
+                return self.http.request(*args, **kw)
+            except requests.RequestException as e:
+                # A cancelled primary is not an ERP failure; keep it out of the breaker
+                if threading.get_ident() in _cancelled:
+                    raise HedgeLost(stage) from e
+                raise
+
+        t0 = time.perf_counter()
+        with trace.stage(stage):
+            try:
+                res = ADMISSION.call(stage, http, method, url, **kwargs)
+            except requests.Timeout as e:
+                raise DeadlineExceeded(f"⏱️ ERP Timeout ({stage})") from e
+            # Streamed bodies report their size when the ErpStream closes
+            trace.observe_response(stage, res, None if kwargs.get('stream') else len(res.content))
+        STAGE_LATENCY.record(stage.replace('_hedge', ''), time.perf_counter() - t0)
+        return res
+
+    def login(self, client_ua=None, trace=None):
+        trace = trace or Trace()
+        headers = erp_headers(client_ua)
+        self.logged_in_at = 0.0
+        self.http.cookies.clear()
+        self._send(trace, 'login', 'POST', LOGIN_URL, data=CREDENTIALS, headers=headers)
+
+        headers['Referer'] = MENU_REFERER
+        try:
+            for stage, url in zip(('menu_valid', 'menu_session'), MENU_URLS):
+                self._send(trace, stage, 'GET', url, headers=headers)
+        except requests.RequestException: pass
+        self.logged_in_at = time.time()
+
+    def request(self, method, url, stage='erp', trace=None, **kwargs):
+        trace = trace or Trace()
+        res = self._send(trace, stage, method, url, **kwargs)
+        if is_expired(res):
+            # Expired calls were rejected before doing anything, so replaying is safe
+            self.login(kwargs.get('headers', {}).get('User-Agent'), trace)
+            res = self._send(trace, stage, method, url, **kwargs)
+            if is_expired(res):
+                raise SessionExpired("❌ ERP Login Failed")
+        return res
+
+    def stream(self, method, url, stage='erp', trace=None, **kwargs):
+        """Like request(), but the body is left on the wire and returned as an ErpStream."""
+        trace = trace or Trace()
+        body = ErpStream(self._send(trace, stage, method, url, stream=True, **kwargs), stage, trace)
+        if body.expired():
+            body.close()
+            self.login(kwargs.get('headers', {}).get('User-Agent'), trace)
+            body = ErpStream(self._send(trace, stage, method, url, stream=True, **kwargs), stage, trace)
+            if body.expired():
+                body.close()
+                raise SessionExpired("❌ ERP Login Failed")
+        return body
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def heartbeat(self, trace=None):
+        """Cheap authenticated call; PHP's idle timer restarts with every request."""
+        headers = erp_headers()
+        headers['Referer'] = MENU_REFERER
+        self.get(MENU_URLS[0], stage='heartbeat', trace=trace, headers=headers)
+        self.logged_in_at = time.time()
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+class SessionPool:
+    """Thread-safe pool of warm ErpSessions, created lazily up to `size`."""
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create: self._created += 1
+        if create:
+            return ErpSession()
+        try:
+            return self._idle.get(timeout=CHECKOUT_TIMEOUT)
+        except queue.Empty:
+            raise PoolTimeout("⚠️ Server Busy, Try Again") from None
+
+    def try_checkout(self):
+        """An idle, already logged-in session, or None; never blocks or logs in."""
+        try:
+            erp = self._idle.get_nowait()
+        except queue.Empty:
+            return None
+        if erp.stale:
+            self._idle.put(erp)
+            return None
+        return erp
+
+    def checkin(self, erp):
+        erp.last_used = time.time()
+        self._idle.put(erp)
+
+    @contextmanager
+    def session(self, client_ua=None, trace=None):
+        erp = self._checkout()
+        try:
+            if erp.stale:
+                erp.login(client_ua, trace)
+            yield erp
+        finally:
+            self.checkin(erp)
+
+    def warm(self, count=None):
+        """Log in up to `count` sessions ahead of the first request; returns how many are ready."""
+        count = self.size if count is None else min(count, self.size)
+        sessions = [self._checkout() for _ in range(count)]
+        try:
+            for erp in sessions:
+                if erp.stale:
+                    erp.login()
+        finally:
+            for erp in sessions:
+                self.checkin(erp)
+        return sum(not erp.stale for erp in sessions)
+
+    def heartbeat(self, interval=HEARTBEAT_INTERVAL):
+        """Ping (or log in again) sessions that sat idle for `interval`; busy ones stay untouched."""
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        now = time.time()
+        due = [erp for erp in idle if now - erp.last_used >= interval]
+        # Put the rest back oldest first so the LIFO order is unchanged
+        for erp in reversed(idle):
+            if erp not in due:
+                self._idle.put(erp)
+        for erp in due:
+            try:
+                if erp.stale:
+                    erp.login()
+                else:
+                    erp.heartbeat()
+            except Exception:
+                erp.logged_in_at = 0.0
+            finally:
+                self.checkin(erp)
+
+    def hedged_stream(self, erp, url, stage, trace=None, **kwargs):
+        """Streamed GET on `erp`; once it runs past the stage p95 a duplicate goes out on an idle session.
+
+        The primary runs on the calling thread and only the duplicate uses the
+        executor. If the duplicate answers first, the primary's socket is shut
+        down, so `erp` is no longer in use when this returns.
+        """
+        def send(session, name):
+            return session.stream('GET', url, stage=name, trace=trace, **kwargs)
+
+        delay = STAGE_LATENCY.p95(stage) if stage in HEDGE_STAGES else None
+        if delay is None:
+            return send(erp, stage)
+
+        race = _Race()
+        deadline, caller, started = current_deadline(), threading.get_ident(), time.monotonic()
+
+        def hedge():
+            if race.primary_done.wait(max(0.0, delay - (time.monotonic() - started))):
+                return None
+            backup = self.try_checkout()
+            if backup is None:
+                return None
+            try:
+                with bind_deadline(deadline):
+                    body = send(backup, f"{stage}_hedge")
+            except Exception:
+                self.checkin(backup)
+                return None
+            # The backup session stays out of the pool until its stream is closed
+            body.on_close = lambda: self.checkin(backup)
+            with race.lock:
+                lost = race.primary == 'ok'
+                if not lost:
+                    race.winner = body
+                    if race.primary is None:
+                        _cancel(caller)
+            if lost:
+                body.close()
+                return None
+            return body
+
+        future = _hedge_executor.submit(hedge)
+        try:
+            body = send(erp, stage)
+        except Exception:
+            with race.lock:
+                race.primary = 'failed'
+                _cancelled.discard(caller)
+            race.primary_done.set()
+            # Waits for a duplicate that is still on its way
+            winner = future.result()
+            if winner is None:
+                raise
+            return winner
+        with race.lock:
+            race.primary = 'ok'
+            _cancelled.discard(caller)
+            winner = race.winner
+        race.primary_done.set()
+        if winner is not None:
+            # The primary got through despite being cancelled; keep it
+            winner.close()
+        return body
@@ -0,0 +1,24 @@
+# Read by gunicorn from the working directory; command-line flags still win.
+import os
+import tempfile
+
+# Workers share their metrics through this directory; see metrics.py
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "challan-metrics"))
+
+
+def on_starting(server):
+    # Counts left by a previous run would otherwise be added to this one's
+    import metrics
+    metrics.reset_dir()
+
+
+def post_worker_init(worker):
+    # The app module is imported by now, so its session pool exists; warm it in the
+    # background and let /ready hold traffic off this worker until it is logged in.
+    from app import warm_up
+    warm_up()
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.retire(worker.pid)
@@ -0,0 +1,94 @@
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# --- ASYNC JOBS ---
+# Job state lives in small JSON files so a poll that lands on another gunicorn
+# worker still finds the job; the work itself runs on this worker's pool.
+JOB_DIR = os.environ.get("JOB_DIR", os.path.join(tempfile.gettempdir(), "challan-jobs"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_TTL = int(os.environ.get("JOB_TTL", "900"))
+# A job not done by then, or whose worker process is gone, is reported as failed
+JOB_MAX_RUNTIME = int(os.environ.get("JOB_MAX_RUNTIME", "180"))
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, job_dir=JOB_DIR, ttl=JOB_TTL, max_runtime=JOB_MAX_RUNTIME):
+        self.job_dir = job_dir
+        self.ttl = ttl
+        self.max_runtime = max_runtime
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._last_prune = 0.0
+        os.makedirs(job_dir, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def _write(self, job_id, record):
+        tmp = self._path(job_id) + f".{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp, self._path(job_id))
+
+    def submit(self, fn, *args, **kwargs):
+        job_id = uuid.uuid4().hex
+        created = time.time()
+        self._write(job_id, {"job_id": job_id, "state": "queued", "created": created, "pid": os.getpid()})
+        self._executor.submit(self._run, job_id, created, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, created, fn, args, kwargs):
+        if time.time() - created > self.max_runtime:
+            # Pollers were already told this job failed; don't let it save behind their back
+            self._write(job_id, {"job_id": job_id, "state": "done", "created": created, "finished": time.time(),
+                                 "status": "error", "message": "⚠️ Job Interrupted, Try Again"})
+            return
+        self._write(job_id, {"job_id": job_id, "state": "running", "created": created, "pid": os.getpid()})
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            result = {"status": "error", "message": str(e) or type(e).__name__}
+        self._write(job_id, {"job_id": job_id, "state": "done", "created": created, "finished": time.time(), **result})
+        self._prune()
+
+    def get(self, job_id):
+        if not _JOB_ID.match(job_id or ""):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # A recycled or crashed worker leaves its jobs queued/running forever
+        if job['state'] != 'done' and (time.time() - job['created'] > self.max_runtime or not _pid_alive(job.get('pid', os.getpid()))):
+            return {**job, "state": "done", "status": "error", "message": "⚠️ Job Interrupted, Try Again"}
+        return job
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for name in os.listdir(self.job_dir):
+            path = os.path.join(self.job_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Counter
+
+# --- SUBMISSION JOURNAL ---
+# Append-only SQLite (WAL) log of every submission, shared by all gunicorn workers.
+# Point JOURNAL_DB at a persistent disk to keep history across restarts.
+JOURNAL_DB = os.environ.get("JOURNAL_DB", os.path.join(tempfile.gettempdir(), "challan-journal.sqlite3"))
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+SAVED_CACHE_SIZE = int(os.environ.get("JOURNAL_CACHE_SIZE", "5000"))
+
+JOURNAL_EVENTS = Counter("challan_journal_total", "Submission journal lookups and writes.", ("result",))
+
+COLUMNS = ('id', 'ts', 'challan', 'company_id', 'status', 'message', 'challan_no', 'system_id',
+           'report1_url', 'report2_url', 'duration_ms', 'stage', 'source', 'pending')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    challan TEXT NOT NULL,
+    company_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    message TEXT,
+    challan_no TEXT,
+    system_id TEXT,
+    report1_url TEXT,
+    report2_url TEXT,
+    duration_ms INTEGER,
+    stage TEXT,
+    source TEXT,
+    pending TEXT
+);
+CREATE INDEX IF NOT EXISTS submissions_saved ON submissions (challan, company_id) WHERE status = 'success';
+CREATE INDEX IF NOT EXISTS submissions_challan ON submissions (challan);
+CREATE INDEX IF NOT EXISTS submissions_challan_no ON submissions (challan_no);
+CREATE INDEX IF NOT EXISTS submissions_system_id ON submissions (system_id) WHERE status = 'success';
+"""
+
+
+class Journal:
+    """Who submitted what and how it ended; answers "already saved?" without the ERP."""
+
+    def __init__(self, path=JOURNAL_DB, cache_size=SAVED_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._local = threading.local()
+        # Saved challans never become unsaved, so hits need no TTL; the most recent are kept in memory
+        self._saved = OrderedDict()
+        self._saved_lock = threading.Lock()
+
+    def _conn(self):
+        # Per thread and per pid, opened on first use: a connection must not cross
+        # a fork, and with --preload this module is imported in the master
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            if 'pending' not in {r[1] for r in conn.execute("PRAGMA table_info(submissions)")}:
+                try:
+                    conn.execute("ALTER TABLE submissions ADD COLUMN pending TEXT")
+                except sqlite3.OperationalError:
+                    pass  # another worker added it first
+            conn.row_factory = sqlite3.Row
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def saved(self, challan, company_id):
+        """The successful submission for (challan, company_id), or None."""
+        key = (str(challan), str(company_id))
+        with self._saved_lock:
+            record = self._saved.get(key)
+            if record is not None:
+                self._saved.move_to_end(key)
+        if record is None:
+            try:
+                row = self._conn().execute(
+                    "SELECT * FROM submissions WHERE challan = ? AND company_id = ? AND status = 'success' ORDER BY id LIMIT 1",
+                    key).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is not None:
+                record = dict(row)
+                with self._saved_lock:
+                    self._saved[key] = record
+                    while len(self._saved) > self.cache_size:
+                        self._saved.popitem(last=False)
+        JOURNAL_EVENTS.inc('hit' if record is not None else 'miss')
+        return record
+
+    def has_system_id(self, system_id):
+        """Whether this portal saved a challan as `system_id`; only those reports are served."""
+        try:
+            row = self._conn().execute(
+                "SELECT 1 FROM submissions WHERE system_id = ? AND status = 'success' LIMIT 1", (str(system_id),)).fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None
+
+    def pending_save(self, challan, company_id, system_id=None):
+        """The partial save of (challan, company_id) still missing bundles, or None.
+
+        Only the latest ERP submission that got a system id counts, so a resume
+        that finished the challan closes it.
+        """
+        sql = "SELECT system_id, challan_no, pending FROM submissions WHERE challan = ? AND company_id = ? AND source = 'erp' AND system_id IS NOT NULL"
+        args = [str(challan), str(company_id)]
+        if system_id is not None:
+            sql += " AND system_id = ?"
+            args.append(str(system_id))
+        try:
+            row = self._conn().execute(sql + " ORDER BY id DESC LIMIT 1", args).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or not row['pending']:
+            return None
+        return {"system_id": row['system_id'], "challan_no": row['challan_no'], "barcodes": json.loads(row['pending'])}
+
+    def record(self, challan, company_id, result, duration, source='erp'):
+        pending = result.get('pending_barcodes')
+        values = (time.time(), str(challan), str(company_id), result.get('status', 'error'), result.get('message'),
+                  result.get('challan_no'), result.get('system_id'), result.get('report1_url'), result.get('report2_url'),
+                  int(duration * 1000), result.get('stage'), source, json.dumps(pending) if pending else None)
+        try:
+            self._conn().execute(f"INSERT INTO submissions ({', '.join(COLUMNS[1:])}) VALUES ({', '.join('?' * len(values))})", values)
+        except sqlite3.Error:
+            JOURNAL_EVENTS.inc('write_error')
+            return
+        JOURNAL_EVENTS.inc('write')
+
+    def history(self, page=1, per_page=HISTORY_PAGE_SIZE, q=None, company_id=None, status=None):
+        """Newest first; `q` matches a challan, a new challan number or a system id by prefix."""
+        per_page = max(1, min(per_page, HISTORY_MAX_PAGE_SIZE))
+        page = max(1, page)
+        where, args = [], []
+        if q:
+            where.append("(challan LIKE ? OR challan_no LIKE ? OR system_id = ?)")
+            prefix = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            args += [prefix, prefix, q]
+        if company_id:
+            where.append("company_id = ?")
+            args.append(str(company_id))
+        if status:
+            where.append("status = ?")
+            args.append(status)
+        sql = "SELECT * FROM submissions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql = sql.replace("LIKE ?", "LIKE ? ESCAPE '\\'") + " ORDER BY id DESC LIMIT ? OFFSET ?"
+        # One extra row says whether there is a next page without a COUNT(*) scan
+        rows = self._conn().execute(sql, args + [per_page + 1, (page - 1) * per_page]).fetchall()
+        return {"page": page, "per_page": per_page, "has_more": len(rows) > per_page,
+                "items": [{k: r[k] for k in COLUMNS if k != 'pending'} for r in rows[:per_page]]}
@@ -0,0 +1,293 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- METRICS (Prometheus text format) ---
+# With METRICS_DIR set (gunicorn.conf.py does), every worker keeps a snapshot of
+# its metrics in <pid>.json there and /metrics sums them all, so whichever
+# worker answers the scrape, counters never go backwards. Without it, as under
+# `python app.py`, metrics are this process's only.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+_registry = []
+
+
+def _fmt_labels(names, values, extra=()):
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind, mode = 'counter', 'sum'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        _start_flusher()
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(lv), v] for lv, v in self._values.items()]
+
+    def render(self, series):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for lv, v in sorted(series.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labels, lv)} {v}")
+        return lines
+
+
+class Gauge(Counter):
+    """Summed across workers, or the largest value with merge='max'; dead workers drop out."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), merge='sum'):
+        super().__init__(name, help_text, labels)
+        self.mode = merge
+
+    def set(self, *label_values, value):
+        _start_flusher()
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+    kind = mode = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_text, labels, buckets
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        _start_flusher()
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b: s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(lv), [list(counts), total, n]] for lv, (counts, total, n) in self._series.items()]
+
+    def render(self, series):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for lv, (counts, total, n) in sorted(series.items()):
+            for b, c in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, lv, [('le', b)])} {c}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, lv, [('le', '+Inf')])} {n}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, lv)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, lv)} {n}")
+        return lines
+
+
+# --- Sharing between gunicorn workers ---
+# A snapshot is {name: {"kind", "mode", "series": [[labels, value], ...]}}; it
+# carries its own merge rule, so the master can fold one without the app loaded.
+_MERGE = {
+    'sum': lambda a, b: a + b,
+    'max': max,
+    'histogram': lambda a, b: [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]],
+}
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _snapshot():
+    return {m.name: {"kind": m.kind, "mode": m.mode, "series": m.snapshot()} for m in _registry}
+
+
+def _merge(snapshots, gauges=True):
+    merged = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            if metric["kind"] == 'gauge' and not gauges:
+                continue
+            entry = merged.setdefault(name, {"kind": metric["kind"], "mode": metric["mode"], "series": {}})
+            series, fn = entry["series"], _MERGE[metric["mode"]]
+            for lv, v in metric["series"]:
+                lv = tuple(lv)
+                series[lv] = fn(series[lv], v) if lv in series else v
+    return merged
+
+
+def _write(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _dir_lock(shared):
+    fd = os.open(os.path.join(METRICS_DIR, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    return fd
+
+
+def flush():
+    """Write this worker's snapshot to METRICS_DIR/<pid>.json."""
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), _snapshot())
+
+
+def _start_flusher():
+    # Per pid: with --preload the module is imported in the master, and threads
+    # do not survive the fork into a worker
+    global _flusher_pid
+    if not METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            try:
+                flush()
+            except OSError:
+                pass
+
+    threading.Thread(target=run, name="metrics-flush", daemon=True).start()
+
+
+def reset_dir():
+    """Start from zero; the gunicorn master calls this before any worker exists."""
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        for name in os.listdir(METRICS_DIR):
+            if name.endswith(".json"):
+                os.remove(os.path.join(METRICS_DIR, name))
+
+
+def retire(pid):
+    """Fold an exited worker's counters and histograms into dead.json; its gauges go."""
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, f"{pid}.json")
+    if not os.path.exists(path):
+        return
+    fd = _dir_lock(shared=False)
+    try:
+        dead_path = os.path.join(METRICS_DIR, "dead.json")
+        merged = _merge([_read(dead_path), _read(path)], gauges=False)
+        for metric in merged.values():
+            metric["series"] = [[list(lv), v] for lv, v in metric["series"].items()]
+        _write(dead_path, merged)
+        os.remove(path)
+    finally:
+        os.close(fd)
+
+
+def _collect():
+    if not METRICS_DIR:
+        return _merge([_snapshot()])
+    # Our own file first, so a later scrape on another worker never sees less
+    flush()
+    fd = _dir_lock(shared=True)
+    try:
+        snaps = []
+        for name in os.listdir(METRICS_DIR):
+            if not name.endswith(".json"):
+                continue
+            snap = _read(os.path.join(METRICS_DIR, name))
+            if name[:-5].isdigit() and not _pid_alive(int(name[:-5])):
+                # Exited but not retired yet: its counters still count, its gauges do not
+                snap = {k: v for k, v in snap.items() if v["kind"] != 'gauge'}
+            snaps.append(snap)
+    finally:
+        os.close(fd)
+    return _merge(snaps)
+
+
+def render_metrics():
+    merged = _collect()
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render(merged.get(metric.name, {}).get("series", {})))
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram("erp_stage_seconds", "Latency of each ERP call stage.", ("stage",))
+STAGE_RETRIES = Counter("erp_stage_retries_total", "Retries performed by the urllib3 Retry adapter.", ("stage",))
+RESPONSE_BYTES = Histogram("erp_response_bytes", "ERP response body size.", ("stage",), SIZE_BUCKETS)
+STAGE_ERRORS = Counter("erp_stage_errors_total", "Exceptions raised while in a stage.", ("stage", "kind"))
+REQUEST_SECONDS = Histogram("challan_request_seconds", "End-to-end process_data latency.", ("outcome",))
+BUNDLES = Histogram("challan_bundles", "Bundles per submitted challan.", (), COUNT_BUCKETS)
+
+
+class Trace:
+    """Per-request timings; feeds the histograms and the Server-Timing header."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.current = None
+
+    @contextmanager
+    def stage(self, name):
+        prev, self.current = self.current, name
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            STAGE_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            dur = time.perf_counter() - t0
+            STAGE_SECONDS.observe(dur, name)
+            self.stages.append((name, dur))
+            self.current = prev
+
+    def observe_response(self, name, res, size=None):
+        retries = getattr(res.raw, 'retries', None)
+        if retries is not None and retries.history:
+            STAGE_RETRIES.inc(name, amount=len(retries.history))
+        if size is not None:
+            RESPONSE_BYTES.observe(size, name)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        parts = [f"{name};dur={dur * 1000:.1f}" for name, dur in self.stages]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
@@ -0,0 +1,55 @@
+import functools
+import re
+
+# --- POPUP PARSER (populate_data_from_challan_popup) ---
+# The popup answers with a block of jQuery assignments, one per form field:
+#   $('#cbo_source').val('1');
+POPUP_FIELDS = ('cbo_source', 'cbo_emb_company', 'cbo_line_no', 'cbo_location', 'cbo_floor')
+
+# This is the form the ERP writes; anything else is left to get_val(). When only
+# some ids are wanted, re factors their shared prefix (`cbo_` for POPUP_FIELDS)
+# out of the alternation, so the engine jumps between candidates with a literal
+# search instead of stopping at every other field's assignment.
+_ANY = re.compile(r"\$\('#([\w-]+)'\)\.val\('([^']*)'\)")
+
+
+@functools.lru_cache(maxsize=32)
+def _assign_pattern(names):
+    return re.compile(r"\$\('#(" + "|".join(map(re.escape, names)) + r")'\)\.val\('([^']*)'\)")
+
+
+_GET_VAL = {name: re.compile(re.escape(name) + r".*?\.val\(\s*['\"]?([^'\")]+)['\"]?\s*\)") for name in POPUP_FIELDS}
+
+
+def parse_popup(text, names=POPUP_FIELDS):
+    """`$('#id').val('...')` assignments as {id: value}; the first of an id wins.
+
+    Only `names` are matched, and the scan stops once all of them are found;
+    names=None returns every field the popup sets, for validation or caching
+    beyond the five process_data needs.
+    """
+    if names is None:
+        return dict(reversed(_ANY.findall(text)))
+    names = tuple(names)
+    values = {}
+    for m in _assign_pattern(names).finditer(text):
+        values.setdefault(m.group(1), m.group(2))
+        if len(values) == len(names):
+            break
+    return values
+
+
+def get_val(id_name, text):
+    """The original per-field lookup, kept for fields written some other way."""
+    pattern = _GET_VAL.get(id_name) or re.compile(re.escape(id_name) + r".*?\.val\(\s*['\"]?([^'\")]+)['\"]?\s*\)")
+    m = pattern.search(text)
+    return m.group(1).strip() if m else '0'
+
+
+def popup_values(text, names=POPUP_FIELDS):
+    """parse_popup() with stripped values; get_val() fills in any of `names` it found empty or not at all."""
+    values = parse_popup(text, names)
+    for name in names:
+        v = values.get(name, '').strip()
+        values[name] = v if v else get_val(name, text)
+    return values
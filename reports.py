@@ -0,0 +1,147 @@
+import gzip
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from deadline import CONNECT_TIMEOUT
+from erp_session import SAVE_URL, erp_headers
+from metrics import Counter, Trace
+from singleflight import SingleFlight
+
+# --- PRINT REPORT CACHE ---
+# Both print reports are rendered by the ERP once, right after the save, and
+# kept gzipped on disk so every later print is a local file read.
+REPORT_DIR = os.environ.get("REPORT_DIR", os.path.join(tempfile.gettempdir(), "challan-reports"))
+REPORT_CACHE_BYTES = int(os.environ.get("REPORT_CACHE_MB", "256")) * 1024 * 1024
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", "2"))
+# Reports are big HTML tables and not on any user's deadline
+REPORT_TIMEOUT = float(os.environ.get("REPORT_TIMEOUT", "60"))
+
+REPORT_ACTIONS = {
+    'call_list': ("1*{sys_id}*3*%E2%9D%8F%20Bundle%20Wise%20Sewing%20Input*1*undefined*undefined*undefined", 'emblishment_issue_print_13'),
+    'challan': ("1*{sys_id}*3*%E2%9D%8F%20Bundle%20Wise%20Sewing%20Input*undefined*undefined*undefined*1", 'sewing_input_challan_print_5'),
+}
+# Relative images and stylesheets in the report still resolve against the ERP
+BASE_HREF = SAVE_URL.rsplit('/', 1)[0] + '/'
+
+REPORT_EVENTS = Counter("challan_report_cache_total", "Print report cache hits, fetches and failures.", ("result",))
+
+_SYS_ID = re.compile(r"^\d{1,12}$")
+_HEAD = re.compile(r"<head[^>]*>", re.I)
+
+
+def erp_report_url(sys_id, kind):
+    data, action = REPORT_ACTIONS[kind]
+    return f"{SAVE_URL}?data={data.format(sys_id=sys_id)}&action={action}"
+
+
+def inject_base(html):
+    tag = f'<base href="{BASE_HREF}">'
+    m = _HEAD.search(html)
+    return html[:m.end()] + tag + html[m.end():] if m else tag + html
+
+
+class ReportCache:
+    def __init__(self, pool, report_dir=REPORT_DIR, max_bytes=REPORT_CACHE_BYTES):
+        self.pool = pool
+        self.report_dir = report_dir
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+        # Two phones printing the same fresh challan still make the ERP render it once
+        self._flight = SingleFlight(os.path.join(report_dir, "inflight"))
+        self._evict_lock = threading.Lock()
+        os.makedirs(report_dir, exist_ok=True)
+
+    @staticmethod
+    def valid(sys_id, kind):
+        return kind in REPORT_ACTIONS and bool(_SYS_ID.match(sys_id or ""))
+
+    def _path(self, sys_id, kind):
+        return os.path.join(self.report_dir, f"{sys_id}.{kind}.html.gz")
+
+    def prefetch(self, sys_id, client_ua=None):
+        self._executor.submit(self._prefetch, sys_id, client_ua)
+
+    def _prefetch(self, sys_id, client_ua):
+        # Only ever on an idle session, and handed back between the two reports:
+        # a slow render must not keep a pooled session from the next save. With
+        # none idle the report is skipped and the route fetches it on demand.
+        for kind in REPORT_ACTIONS:
+            if os.path.exists(self._path(sys_id, kind)):
+                continue
+            session = self.pool.try_checkout()
+            if session is None:
+                REPORT_EVENTS.inc('prefetch_skipped')
+                continue
+            try:
+                self.fetch(sys_id, kind, client_ua, session)
+            except Exception:
+                REPORT_EVENTS.inc('prefetch_error')
+            finally:
+                self.pool.checkin(session)
+
+    def get(self, sys_id, kind, client_ua=None):
+        """Gzipped report bytes, fetching from the ERP on a miss."""
+        path = self._path(sys_id, kind)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            os.utime(path)
+            REPORT_EVENTS.inc('hit')
+            return body
+        except OSError:
+            pass
+        path = self.fetch(sys_id, kind, client_ua)
+        with open(path, "rb") as f:
+            return f.read()
+
+    def fetch(self, sys_id, kind, client_ua=None, session=None):
+        return self._flight.do(f"{sys_id}|{kind}", lambda: self._fetch(sys_id, kind, client_ua, session))
+
+    def _fetch(self, sys_id, kind, client_ua, session):
+        path = self._path(sys_id, kind)
+        if os.path.exists(path):
+            return path
+        if session is None:
+            with self.pool.session(client_ua) as session:
+                return self._fetch(sys_id, kind, client_ua, session)
+        headers = erp_headers(client_ua)
+        del headers['Content-Type']
+        res = session.get(erp_report_url(sys_id, kind), headers=headers, stage='report', trace=Trace(),
+                          timeout=(CONNECT_TIMEOUT, REPORT_TIMEOUT))
+        if res.status_code != 200 or not res.text.strip():
+            REPORT_EVENTS.inc('fetch_error')
+            raise RuntimeError(f"❌ Report Unavailable ({res.status_code})")
+        body = gzip.compress(inject_base(res.text).encode('utf-8'), 6)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+        REPORT_EVENTS.inc('fetch')
+        self._evict()
+        return path
+
+    def _evict(self):
+        # Least recently served first; hits bump the mtime
+        with self._evict_lock:
+            entries = []
+            for name in os.listdir(self.report_dir):
+                if not name.endswith(".html.gz"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.report_dir, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+            total = sum(e[1] for e in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.report_dir, name))
+                    total -= size
+                    REPORT_EVENTS.inc('evict')
+                except OSError:
+                    pass
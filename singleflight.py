@@ -0,0 +1,144 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from metrics import Counter
+
+# --- SINGLE-FLIGHT SUBMISSIONS ---
+INFLIGHT_DIR = os.environ.get("INFLIGHT_DIR", os.path.join(tempfile.gettempdir(), "challan-inflight"))
+# How long a finished result is handed to workers that were queued behind it
+RESULT_TTL = int(os.environ.get("INFLIGHT_RESULT_TTL", "30"))
+# Lock and result files untouched for this long are removed
+FILE_TTL = max(RESULT_TTL, int(os.environ.get("INFLIGHT_FILE_TTL", "600")))
+
+SHARED_RESULTS = Counter("challan_singleflight_shared_total", "Duplicate submissions answered with another request's result.", ("scope",))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run `fn` once per key at a time; duplicates wait and get the same result.
+
+    Threads in one worker share a _Call. Across gunicorn workers the leader holds
+    an flock on a per-key file and leaves its result next to it for the others.
+    """
+
+    def __init__(self, lock_dir=INFLIGHT_DIR):
+        self.lock_dir = lock_dir
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            SHARED_RESULTS.inc('thread')
+        else:
+            try:
+                call.result = self._run_locked(key, fn)
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+                self._prune()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _run_locked(self, key, fn):
+        base = os.path.join(self.lock_dir, hashlib.sha1(key.encode()).hexdigest())
+        started = time.time()
+        fd, waited = self._lock_file(base + ".lock")
+        try:
+            if waited:
+                result = self._read_result(base, started)
+                if result is not None:
+                    SHARED_RESULTS.inc('worker')
+                    return result
+            result = fn()
+            self._write_result(base, result)
+            return result
+        finally:
+            os.close(fd)
+
+    def _lock_file(self, path):
+        """flock `path`; returns (fd, whether we had to wait for another holder)."""
+        waited = False
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waited = True
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            # _prune may have unlinked the file while we waited; a lock on a
+            # removed inode would not keep out whoever creates the next one.
+            try:
+                if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                    os.utime(fd)
+                    return fd, waited
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if now - os.path.getmtime(path) <= FILE_TTL:
+                    continue
+                if not name.endswith(".lock"):
+                    os.remove(path)
+                    continue
+                # Only remove a lock nobody holds, and do it while holding it
+                fd = os.open(path, os.O_RDWR)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.remove(path)
+                except BlockingIOError:
+                    pass
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+
+    def _read_result(self, base, since):
+        try:
+            with open(base + ".json") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Only a result that finished while we were waiting counts as "the same request"
+        if record['finished'] < since or time.time() - record['finished'] > RESULT_TTL:
+            return None
+        return record['result']
+
+    def _write_result(self, base, result):
+        tmp = f"{base}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"finished": time.time(), "result": result}, f)
+            os.replace(tmp, base + ".json")
+        except (OSError, TypeError, ValueError):
+            pass